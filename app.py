@@ -1,101 +1,147 @@
+import startup_budget
+run_started = startup_budget.begin_run()
 import streamlit as st
 import validators
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain.chains.summarize import load_summarize_chain
-from langchain_community.document_loaders import UnstructuredURLLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-# Corrected import for youtube-transcript-api exceptions (v1.0.3 uses NoTranscriptFound)
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
-import re
 import urllib3
 import time
 import random
+import re
+import jobs
+import map_executor
+import pipeline
+import tracing
+from config import GROQ_API_KEY, GROQ_RPM, GROQ_TPM, JOB_KEEP_SECONDS, JOB_WORKERS, MAP_CONCURRENCY, METRICS_PORT, REDUCE_FAN_IN, is_api_key_present, is_api_key_plausible
+from sources import extract_youtube_id, is_youtube_url
 
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# --- IMPORTANT ---
-# Replace with your actual Groq API key before deployment if needed
-GROQ_API_KEY = "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" # Replace this with your actual API key
-
-# --- Functions (extract_youtube_id, get_youtube_transcript - unchanged from previous version) ---
-def extract_youtube_id(url):
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([\w-]+)',
-        r'(?:youtube\.com\/embed\/)([\w-]+)',
-        r'(?:youtube\.com\/v\/)([\w-]+)'
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def get_youtube_transcript(video_id):
-    try:
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-        try:
-            transcript = transcript_list.find_transcript(['en'])
-            st.markdown("""<div class="success-message"><span>✅ Found English transcript!</span></div>""", unsafe_allow_html=True)
-            fetched = transcript.fetch()
-            return " ".join([t['text'] for t in fetched])
-        except NoTranscriptFound:
-            try:
-                st.markdown("""<div class="info-message"><span>ℹ️ English transcript not available. Trying Hindi...</span></div>""", unsafe_allow_html=True)
-                transcript = transcript_list.find_transcript(['hi'])
-                st.markdown("""<div class="success-message"><span>✅ Found Hindi transcript!</span></div>""", unsafe_allow_html=True)
-                st.markdown("""<div class="info-message"><span>⏳ Translating Hindi transcript to English...</span></div>""", unsafe_allow_html=True)
-                translated_transcript = transcript.translate('en').fetch()
-                st.markdown("""<div class="success-message"><span>✅ Translation complete!</span></div>""", unsafe_allow_html=True)
-                return " ".join([t['text'] for t in translated_transcript])
-            except NoTranscriptFound:
-                st.markdown("""<div class="info-message"><span>ℹ️ Hindi transcript not available. Trying other languages...</span></div>""", unsafe_allow_html=True)
-                available_languages = [t.language for t in transcript_list]
-                st.markdown(f"""<div class="info-message"><span>ℹ️ Available languages: {', '.join(available_languages)}</span></div>""", unsafe_allow_html=True)
-                try:
-                    for available_transcript in transcript_list:
-                        lang = available_transcript.language
-                        lang_code = available_transcript.language_code
-                        st.markdown(f"""<div class="info-message"><span>ℹ️ Found {lang} ({lang_code}) transcript. Processing...</span></div>""", unsafe_allow_html=True)
-                        try:
-                            if lang_code != 'en':
-                                st.markdown(f"""<div class="info-message"><span>⏳ Translating {lang} transcript to English...</span></div>""", unsafe_allow_html=True)
-                                translated = available_transcript.translate('en').fetch()
-                                st.markdown("""<div class="success-message"><span>✅ Translation complete!</span></div>""", unsafe_allow_html=True)
-                                return " ".join([t['text'] for t in translated])
-                            else:
-                                fetched = available_transcript.fetch()
-                                return " ".join([t['text'] for t in fetched])
-                        except Exception as lang_error:
-                            st.markdown(f"""<div class="error-message"><span>⚠️ Error processing {lang} transcript: {str(lang_error)}. Trying next...</span></div>""", unsafe_allow_html=True)
-                            continue
-                    st.markdown("""<div class="error-message"><span>❌ No usable transcripts found after trying all available languages.</span></div>""", unsafe_allow_html=True)
-                    return None
-                except Exception as e:
-                    st.markdown(f"""<div class="error-message"><span>❌ Error iterating through available transcripts: {str(e)}</span></div>""", unsafe_allow_html=True)
-                    return None
-    except TranscriptsDisabled:
-        st.markdown("""<div class="error-message"><span>❌ Transcripts are disabled for this video.</span></div>""", unsafe_allow_html=True)
-        return None
-    except NoTranscriptFound:
-         st.markdown("""<div class="error-message"><span>❌ No transcript was found for this video, even after checking available languages.</span></div>""", unsafe_allow_html=True)
-         return None
-    except Exception as e:
-        if 'Could not retrieve a transcript for the video' in str(e) and 'YouTube is blocking requests from your IP' in str(e):
-             st.markdown(f"""<div class="error-message"><span>❌ Failed to get YouTube transcript. YouTube is likely blocking requests from the server's IP address (common for cloud hosting). Website summarization should still work.</span><br><span>ℹ️ Error Detail: {e}</span></div>""", unsafe_allow_html=True)
-        else:
-            st.markdown(f"""<div class="error-message"><span>❌ An unexpected error occurred while fetching transcripts: {str(e)}</span></div>""", unsafe_allow_html=True)
-            if "For this video" in str(e):
-                 error_msg = str(e)
-                 available_langs = re.findall(r'\* ([a-z\-]+) \("([^"]+)"\)', error_msg)
-                 if available_langs:
-                     lang_codes = [code for code, name in available_langs]
-                     st.markdown(f"""<div class="info-message"><span>ℹ️ Detected available language codes in error: {', '.join(lang_codes)}</span></div>""", unsafe_allow_html=True)
-        return None
+# Everything below is built once per process and shared by all sessions and reruns
+@st.cache_resource
+def get_summary_cache():
+    return pipeline.open_summary_cache()
+
+@st.cache_resource
+def get_chunk_memo_store():
+    return pipeline.open_chunk_memo()
+
+@st.cache_resource
+def get_job_manager():
+    return jobs.JobManager(JOB_WORKERS, JOB_KEEP_SECONDS)
+
+@st.cache_resource
+def get_llm(model_name, max_tokens):
+    return pipeline.make_llm(model_name, max_tokens, GROQ_API_KEY)
+
+@st.cache_resource
+def get_prompts(map_template, combine_template, refine_template):
+    return pipeline.build_prompts(map_template, combine_template, refine_template)
+
+@st.cache_resource
+def get_api_key_status():
+    return is_api_key_present(), is_api_key_plausible()
+
+@st.cache_resource
+def start_metrics_endpoint():
+    return tracing.start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+@st.cache_resource
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).strip()
+
+def show_message(kind, text):
+    st.markdown(f"""<div class="{kind}-message"><span>{text}</span></div>""", unsafe_allow_html=True)
+
+def render_summary_header():
+    st.markdown('<div class="summary-container">', unsafe_allow_html=True)
+    st.subheader("📝 Generated Summary")
+    return st.empty()
+
+def render_summary_footer(summary_text, is_youtube, model_name, chain_type, max_tokens, cached=False):
+    summary_word_count = len(summary_text.split())
+    gen_time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    content_type_display = "YouTube" if is_youtube else "Website"
+    cache_note = " | Cached" if cached else ""
+    st.markdown(f"""<hr><p style="text-align: right; font-size: 0.9rem;">~{summary_word_count} words | {content_type_display} | {model_name} | {chain_type} | Max Tok: {max_tokens}{cache_note} | Gen: {gen_time_str}</p>""", unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def render_summary(summary_text, is_youtube, model_name, chain_type, max_tokens, cached=False):
+    render_summary_header().markdown(summary_text) # Display summary
+    render_summary_footer(summary_text, is_youtube, model_name, chain_type, max_tokens, cached)
+
+def render_performance_panel(trace):
+    with st.expander("⚡ Performance"):
+        rows = trace.breakdown()
+        llm_rows = [r for r in rows if r["stage"].startswith("llm.")]
+        total = (trace.end or time.time()) - trace.start
+        st.markdown(f"**Total:** {total:.2f}s · **LLM calls:** {sum(r['calls'] for r in llm_rows)} · **Tokens:** {sum(r['prompt_tokens'] for r in llm_rows):,} in / {sum(r['completion_tokens'] for r in llm_rows):,} out · **Retries:** {sum(r['retries'] for r in rows)}")
+        st.table(rows)
+        snap = tracing.REGISTRY.snapshot()
+        st.caption("Process-wide aggregates")
+        st.table([{"stage": stage, "count": a["count"], "p50_s": a["p50_s"], "p95_s": a["p95_s"], "p99_s": a["p99_s"], "tokens_per_s": a.get("tokens_per_s")} for stage, a in sorted(snap["stages"].items())])
+        cache_rates = " · ".join(f"{name}: {c['hit_rate']:.0%} of {c['hit'] + c['miss']}" for name, c in snap["caches"].items())
+        if cache_rates: st.caption(f"Cache hit rate — {cache_rates}")
+
+def render_ingest_metrics(slots, stats, chunk_tokens):
+    cards = [(f"{stats['chunks']}", f"Chunks · ~{stats['est_tokens']:,} tokens (≤{chunk_tokens:,}/chunk)"), (f"{stats['characters']:,}", "Characters"),
+             (f"{stats['words']:,}", "Words"), (f"-{stats['chars_removed']:,}", f"Chars Removed · ~{stats['est_tokens_removed']:,} tokens")]
+    for slot, (value, label) in zip(slots, cards):
+        slot.markdown(f"""<div class="metric-card"><div class="metric-value">{value}</div><div class="metric-label">{label}</div></div>""", unsafe_allow_html=True)
+
+def render_progress(progress_bar, kind, text, pct):
+    progress_bar.markdown(f"""<div class="{kind}-message"><span>{text}</span></div><div class="progress-bar"><div class="progress" style="width: {pct}%;"></div></div>""", unsafe_allow_html=True)
+
+def follow_job(job, progress_bar, request, poll_interval=0.2):
+    """Poll a background job, painting its progress, messages, metrics and streamed summary until it ends."""
+    messages_area = st.container()
+    seen, painted, progress, metric_slots, summary_box = 0, {}, None, None, None
+    while True:
+        finished = job.wait(poll_interval)
+        for event in job.events_since(seen):
+            seen += 1
+            if event["type"] == "progress": progress = (event["kind"], event["text"], event["pct"])
+            elif event["type"] == "message":
+                with messages_area: show_message(event["kind"], event["text"])
+            elif event["type"] == "warning": messages_area.warning(event["text"])
+        if job.status == "queued": progress = ("info", f"⏳ Queued (position {get_job_manager().queue_position(job)})...", 10)
+        # Repaint at least every second even if nothing changed: Streamlit only notices a Cancel click
+        # (which reruns the script) while the script is sending something
+        if progress and (painted.get("progress") != progress or time.time() - painted.get("at", 0) >= 1.0):
+            render_progress(progress_bar, *progress); painted.update(progress=progress, at=time.time())
+        stream = job.state.get("stream")
+        if stream is not None:
+            if metric_slots is None:
+                metric_slots = [col.empty() for col in st.columns(4)]
+                with st.expander("📄 Content Preview (First 500 Chars)"): preview_slot = st.empty()
+            stats = stream.stats()
+            if painted.get("stats") != stats:
+                render_ingest_metrics(metric_slots, stats, stream.chunk_tokens); painted["stats"] = stats
+                preview_slot.text(stream.preview + "..." if len(stream.preview) >= stream.PREVIEW_CHARS else stream.preview)
+        preview = job.state.get("preview")
+        if (job.partial or preview) and summary_box is None: summary_box = render_summary_header()
+        if summary_box is not None and not finished:
+            if job.partial and painted.get("partial") != len(job.partial):  # streamed LLM output replaces the preview
+                summary_box.markdown(job.partial + "▌"); painted["partial"] = len(job.partial)
+            elif preview and not job.partial and "preview" not in painted:
+                summary_box.markdown(f"{preview['text']}\n\n*⚡ Instant local preview ({preview['seconds'] * 1000:.0f} ms, extractive) — AI summary in progress...*"); painted["preview"] = True
+        if finished: break
+
+    is_youtube = is_youtube_url(request["url"])
+    if job.status == "done":
+        result = job.result
+        if summary_box is None: summary_box = render_summary_header()
+        summary_box.markdown(result["summary"]) # Display summary
+        reuse_note = f" · ♻️ reused {result['memo_hits']}/{result['memo_hits'] + result['memo_misses']} cached steps" if result["memo_hits"] else ""
+        shared_note = f" · 👥 shared by {job.watchers} requests" if job.watchers > 1 else ""
+        if result.get("fallback"): render_progress(progress_bar, "error", f"⚠️ AI summary unavailable: showing a local {result['fallback']} summary ({result['seconds']:.2f}s)", 100)
+        else: render_progress(progress_bar, "success", f"✅ Summary Complete! ({result['seconds']:.2f}s){reuse_note}{shared_note}", 100)
+        render_summary_footer(result["summary"], is_youtube, request["model"], request["chain_type"], request["max_tokens"])
+    elif job.status == "cancelled": render_progress(progress_bar, "info", "✖ Summarization cancelled", 100)
+    else:
+        st.markdown(f"""<div class="error-message"><span>❌ Summarization failed: {job.error}</span></div>""", unsafe_allow_html=True); st.error("Suggestions: Try different model/method/length.")
+    if "trace" in job.state: render_performance_panel(job.state["trace"])
 
 
 # Custom CSS to make the UI more modern with glassmorphic effect
@@ -104,10 +150,10 @@ st.set_page_config(
     page_icon="📚",
     layout="wide",
 )
+start_metrics_endpoint()
 
 # --- REVISED CSS ---
-st.markdown("""
-<style>
+APP_CSS = """
     /* Target the main app container for gradient background */
     [data-testid="stAppViewContainer"] > .main {
         background: linear-gradient(135deg, #8A2BE2, #FF69B4, #9370DB, #6A5ACD, #BA55D3);
@@ -262,8 +308,8 @@ st.markdown("""
      .content-preview { /* ... */ }
      .text-with-icon { /* ... */ }
 
-</style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(f"<style>{minify_css(APP_CSS)}</style>", unsafe_allow_html=True)
 
 
 # --- App Header (unchanged) ---
@@ -282,19 +328,23 @@ with col2:
     model_name = st.selectbox("Model", ["gemma-7b-it", "llama3-8b-8192", "mixtral-8x7b-32768"], index=0, help="Select AI model")
     chain_type = st.selectbox("Summarization Method", ["map_reduce", "stuff", "refine"], index=0, help="Speed vs. comprehensiveness")
     max_tokens = st.slider("Summary Length (Max Tokens)", 300, 1200, 600, 100, help="Adjust summary detail")
+    resummarize = st.checkbox("Re-summarize", value=False, help="Ignore the cached summary (unchanged chunks are still reused)")
 
     if max_tokens <= 400: summary_type, detail_level = "Concise", "Brief overview"
     elif max_tokens <= 800: summary_type, detail_level = "Balanced", "Moderate detail"
     else: summary_type, detail_level = "Detailed", "In-depth coverage"
     st.markdown(f"""<div class="info-message" style="background-color: rgba(209, 236, 241, 0.4);"><b style="color: white;">{summary_type} Summary</b><br><span style="color: white; opacity: 0.9;">{detail_level}</span></div>""", unsafe_allow_html=True)
 
-    is_api_key_present = GROQ_API_KEY and GROQ_API_KEY != "YOUR_GROQ_API_KEY_HERE"
-    is_api_key_plausible = is_api_key_present and GROQ_API_KEY.startswith("gsk_")
-    if not is_api_key_present: st.markdown("""<div class="error-message" style="background-color: rgba(248, 215, 218, 0.4);"><span style="font-weight: bold; color: white;">⚠️ API Key Missing</span><br><span style="color: white; opacity: 0.9;">Update GROQ_API_KEY variable</span></div>""", unsafe_allow_html=True)
-    elif not is_api_key_plausible: st.markdown("""<div class="error-message" style="background-color: rgba(248, 215, 218, 0.4);"><span style="font-weight: bold; color: white;">⚠️ API Key Invalid Format</span><br><span style="color: white; opacity: 0.9;">Check GROQ_API_KEY format</span></div>""", unsafe_allow_html=True)
+    api_key_present, api_key_plausible = get_api_key_status()
+    if not api_key_present: st.markdown("""<div class="error-message" style="background-color: rgba(248, 215, 218, 0.4);"><span style="font-weight: bold; color: white;">⚠️ API Key Missing</span><br><span style="color: white; opacity: 0.9;">Update GROQ_API_KEY variable</span></div>""", unsafe_allow_html=True)
+    elif not api_key_plausible: st.markdown("""<div class="error-message" style="background-color: rgba(248, 215, 218, 0.4);"><span style="font-weight: bold; color: white;">⚠️ API Key Invalid Format</span><br><span style="color: white; opacity: 0.9;">Check GROQ_API_KEY format</span></div>""", unsafe_allow_html=True)
     else: st.markdown("""<div class="success-message" style="background-color: rgba(223, 240, 216, 0.4);"><span style="font-weight: bold; color: white;">✅ API Ready</span><br><span style="color: white; opacity: 0.9;">Groq API key configured</span></div>""", unsafe_allow_html=True)
+    cache_stats, job_stats = get_summary_cache().stats(), get_job_manager().stats()
+    st.markdown(f"""<div class="info-message" style="background-color: rgba(209, 236, 241, 0.4);"><b style="color: white;">⚡ Summary Cache</b><br><span style="color: white; opacity: 0.9;">{cache_stats['entries']} cached | {cache_stats['hits']} hits / {cache_stats['misses']} misses<br>Jobs: {job_stats['running']} running | {job_stats['queued']} queued | {job_stats['deduplicated']} shared</span></div>""", unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
+    timing_placeholder = st.empty()
+
     st.markdown("""<div class="card"><h4>💡 Tips</h4><ul><li><b>YouTube:</b> May fail on cloud hosting due to IP blocks.</li><li><b>Websites:</b> Best for articles, blogs.</li><li><b>Map-reduce:</b> Good for long content.</li><li><b>Stuff:</b> Fastest for short content.</li><li><b>Refine:</b> Balanced accuracy.</li></ul></div>""", unsafe_allow_html=True)
 
 # --- Main Content Area (unchanged logic, relies on CSS fixes) ---
@@ -305,7 +355,7 @@ with col1:
 
     if url:
         if validators.url(url):
-            is_youtube = "youtube" in url or "youtu.be" in url
+            is_youtube = is_youtube_url(url)
             if is_youtube:
                 icon, url_type = "🎬", "YouTube Video"
                 video_id = extract_youtube_id(url)
@@ -321,17 +371,21 @@ with col1:
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Prompts based on max_tokens (unchanged)
-    if max_tokens <= 400: map_template, combine_template = "Briefly summarize key points:\n\n{text}\n\nCONCISE SUMMARY:", "Combine summaries into 2-3 sentences:\n\n{text}\n\nFINAL CONCISE SUMMARY:"
-    elif max_tokens <= 800: map_template, combine_template = "Summarize main ideas & details:\n\n{text}\n\nBALANCED SUMMARY:", "Create comprehensive summary:\n\n{text}\n\nFINAL BALANCED SUMMARY:"
-    else: map_template, combine_template = "Detailed summary with examples/arguments:\n\n{text}\n\nDETAILED SUMMARY:", "Synthesize into in-depth summary:\n\n{text}\n\nFINAL DETAILED SUMMARY:"
-    map_prompt = PromptTemplate(template=map_template, input_variables=["text"])
-    combine_prompt = PromptTemplate(template=combine_template, input_variables=["text"])
+    templates = pipeline.build_templates(max_tokens)
+    map_prompt, combine_prompt, refine_prompt = get_prompts(*templates)
+
+    job_ref = st.session_state.get("job")
+    active_job = get_job_manager().get(job_ref["id"]) if job_ref else None
+    if job_ref and active_job is None: del st.session_state["job"]  # expired from the job manager
+
+    # --- Startup / rerun time budget: recorded before any summarize/follow work, which can block for the whole job ---
+    timing = startup_budget.end_run(run_started)
+    rerun_note = f" · rerun {timing['last_rerun_ms']:.0f} ms (p50 {timing['p50_rerun_ms']:.0f}, budget {timing['rerun_budget_ms']:.0f})" if timing["reruns"] else ""
+    timing_placeholder.markdown(f"""<div class="info-message" style="background-color: rgba(209, 236, 241, 0.4);"><b style="color: white;">⏱ App Timing</b><br><span style="color: white; opacity: 0.9;">Cold start {timing['cold_start_ms']:.0f} ms (budget {timing['cold_start_budget_ms']:.0f}){rerun_note}</span></div>""", unsafe_allow_html=True)
 
     if summarize_button:
-        is_api_key_present = GROQ_API_KEY and GROQ_API_KEY != "YOUR_GROQ_API_KEY_HERE"
-        is_api_key_plausible = is_api_key_present and GROQ_API_KEY.startswith("gsk_")
-        if not is_api_key_present: st.markdown("""<div class="error-message"><span>⚠️ Update GROQ_API_KEY variable</span></div>""", unsafe_allow_html=True)
-        elif not is_api_key_plausible: st.markdown("""<div class="error-message"><span>⚠️ API Key appears invalid</span></div>""", unsafe_allow_html=True)
+        if not api_key_present: st.markdown("""<div class="error-message"><span>⚠️ Update GROQ_API_KEY variable</span></div>""", unsafe_allow_html=True)
+        elif not api_key_plausible: st.markdown("""<div class="error-message"><span>⚠️ API Key appears invalid</span></div>""", unsafe_allow_html=True)
         elif not url: st.markdown("""<div class="error-message"><span>⚠️ Please enter URL</span></div>""", unsafe_allow_html=True)
         elif not validators.url(url): st.markdown("""<div class="error-message"><span>⚠️ Invalid URL format</span></div>""", unsafe_allow_html=True)
         else:
@@ -339,80 +393,42 @@ with col1:
             with result_area:
                 st.markdown("""<div class="info-message"><span>⏳ Starting...</span></div><div class="progress-bar"><div class="progress" style="width: 5%;"></div></div>""", unsafe_allow_html=True)
                 progress_bar = st.empty()
+                is_youtube = is_youtube_url(url)
+                cache = get_summary_cache()
+                cache_source, cache_key = pipeline.cache_identity(url, model_name, chain_type, max_tokens, *templates)
+                lookup_start = time.time()
+                trace = tracing.Trace("request", url=url, model=model_name, chain_type=chain_type, max_tokens=max_tokens)
+                with tracing.activate(trace):
+                    cached = None if resummarize else pipeline.lookup_summary(cache, cache_key)
+                    if cached and not pipeline.is_current(cached, url): cached = None  # the page changed: re-run, reusing unchanged chunks
+                if cached:
+                    progress_bar.markdown(f"""<div class="success-message"><span>⚡ Loaded cached summary ({(time.time() - lookup_start) * 1000:.0f} ms)</span></div><div class="progress-bar"><div class="progress" style="width: 100%;"></div></div>""", unsafe_allow_html=True)
+                    render_summary(cached["summary"], is_youtube, model_name, chain_type, max_tokens, cached=True)
+                    render_performance_panel(trace.finish())
+                    st.stop()
                 try:
-                    progress_bar.markdown("""<div class="info-message"><span>🔄 Initializing AI ({model_name})...</span></div><div class="progress-bar"><div class="progress" style="width: 15%;"></div></div>""", unsafe_allow_html=True)
-                    time.sleep(0.5)
-                    llm = ChatGroq(model=model_name, groq_api_key=GROQ_API_KEY, max_tokens=max_tokens)
-
-                    is_youtube = "youtube" in url or "youtu.be" in url
-                    docs = None
-                    if is_youtube:
-                        progress_bar.markdown("""<div class="info-message"><span>🎬 Processing YouTube...</span></div><div class="progress-bar"><div class="progress" style="width: 30%;"></div></div>""", unsafe_allow_html=True)
-                        video_id = extract_youtube_id(url)
-                        if not video_id: st.markdown("""<div class="error-message"><span>⚠️ No YouTube ID</span></div>""", unsafe_allow_html=True); st.stop()
-                        transcript = get_youtube_transcript(video_id)
-                        if transcript:
-                            progress_bar.markdown(f"""<div class="success-message"><span>✅ Transcript: {len(transcript):,} chars</span></div><div class="progress-bar"><div class="progress" style="width: 45%;"></div></div>""", unsafe_allow_html=True)
-                            docs = [Document(page_content=transcript, metadata={"source": url})]
-                        else: st.stop() # Error shown in get_youtube_transcript
-                    else: # Website
-                        progress_bar.markdown("""<div class="info-message"><span>🌐 Loading Website...</span></div><div class="progress-bar"><div class="progress" style="width: 30%;"></div></div>""", unsafe_allow_html=True)
-                        try:
-                            loader = UnstructuredURLLoader(urls=[url], ssl_verify=False, headers={"User-Agent": "Mozilla/5.0"})
-                            loaded_docs = loader.load()
-                            if loaded_docs and loaded_docs[0].page_content:
-                                docs = loaded_docs
-                                total_chars_loaded = sum(len(d.page_content) for d in docs)
-                                progress_bar.markdown(f"""<div class="success-message"><span>✅ Website Loaded: {len(docs)} element(s), {total_chars_loaded:,} chars</span></div><div class="progress-bar"><div class="progress" style="width: 45%;"></div></div>""", unsafe_allow_html=True)
-                            else: st.markdown("""<div class="error-message"><span>❌ No content found/parsed</span></div>""", unsafe_allow_html=True); st.stop()
-                        except Exception as e: st.markdown(f"""<div class="error-message"><span>❌ Error loading website: {e}</span></div>""", unsafe_allow_html=True); st.stop()
-
-                    if docs:
-                        progress_bar.markdown("""<div class="info-message"><span>🔄 Splitting text...</span></div><div class="progress-bar"><div class="progress" style="width: 60%;"></div></div>""", unsafe_allow_html=True)
-                        text_splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=200)
-                        split_docs = text_splitter.split_documents(docs)
-
-                        col_a, col_b, col_c = st.columns(3)
-                        character_count = sum(len(doc.page_content) for doc in split_docs)
-                        word_count = sum(len(doc.page_content.split()) for doc in split_docs)
-                        with col_a: st.markdown(f"""<div class="metric-card"><div class="metric-value">{len(split_docs)}</div><div class="metric-label">Chunks</div></div>""", unsafe_allow_html=True)
-                        with col_b: st.markdown(f"""<div class="metric-card"><div class="metric-value">{character_count:,}</div><div class="metric-label">Characters</div></div>""", unsafe_allow_html=True)
-                        with col_c: st.markdown(f"""<div class="metric-card"><div class="metric-value">{word_count:,}</div><div class="metric-label">Words</div></div>""", unsafe_allow_html=True)
-
-                        with st.expander("📄 Content Preview (First 500 Chars)"):
-                             st.markdown('<div class="content-preview">', unsafe_allow_html=True)
-                             preview_text = docs[0].page_content[:500]
-                             st.text(preview_text + "..." if len(docs[0].page_content) > 500 else preview_text)
-                             st.markdown('</div>', unsafe_allow_html=True)
-                        progress_bar.markdown("""<div class="progress-bar"><div class="progress" style="width: 70%;"></div></div>""", unsafe_allow_html=True)
-
-                        progress_bar.markdown(f"""<div class="info-message"><span>🧠 Generating summary ('{chain_type}')...</span></div><div class="progress-bar"><div class="progress" style="width: 80%;"></div></div>""", unsafe_allow_html=True)
-
-                        if chain_type == "map_reduce": chain = load_summarize_chain(llm, chain_type="map_reduce", map_prompt=map_prompt, combine_prompt=combine_prompt, verbose=False)
-                        elif chain_type == "stuff":
-                            total_chars = sum(len(d.page_content) for d in split_docs); est_tokens = total_chars / 4
-                            context_window = 8192 if model_name == "llama3-8b-8192" else 32768 if model_name == "mixtral-8x7b-32768" else 8192
-                            if est_tokens > (context_window * 0.85): st.warning(f"Content (~{est_tokens:.0f} tokens) may be too long for 'stuff' with {model_name} (~{context_window}). Try map_reduce/refine.")
-                            chain = load_summarize_chain(llm, chain_type="stuff", prompt=map_prompt, verbose=False)
-                        else: chain = load_summarize_chain(llm, chain_type="refine", question_prompt=map_prompt, refine_prompt=combine_prompt, verbose=False)
-
-                        try:
-                            with st.spinner(f"🤖 AI ({model_name}) working..."):
-                                start_time = time.time()
-                                result = chain.invoke({"input_documents": split_docs})
-                                end_time = time.time(); summary_time_taken = end_time - start_time
-
-                            progress_bar.markdown(f"""<div class="success-message"><span>✅ Summary Complete! ({summary_time_taken:.2f}s)</span></div><div class="progress-bar"><div class="progress" style="width: 100%;"></div></div>""", unsafe_allow_html=True)
-
-                            st.markdown('<div class="summary-container">', unsafe_allow_html=True)
-                            st.subheader("📝 Generated Summary")
-                            st.markdown(result["output_text"]) # Display summary
-
-                            summary_word_count = len(result["output_text"].split())
-                            gen_time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                            content_type_display = "YouTube" if is_youtube else "Website"
-                            st.markdown(f"""<hr><p style="text-align: right; font-size: 0.9rem;">~{summary_word_count} words | {content_type_display} | {model_name} | {chain_type} | Max Tok: {max_tokens} | Gen: {gen_time_str}</p>""", unsafe_allow_html=True)
-                            st.markdown('</div>', unsafe_allow_html=True)
-
-                        except Exception as e: st.markdown(f"""<div class="error-message"><span>❌ Summarization failed: {e}</span></div>""", unsafe_allow_html=True); st.error("Suggestions: Try different model/method/length.")
+                    progress_bar.markdown(f"""<div class="info-message"><span>🔄 Initializing AI ({model_name})...</span></div><div class="progress-bar"><div class="progress" style="width: 15%;"></div></div>""", unsafe_allow_html=True)
+                    llm = get_llm(model_name, max_tokens)
+                    if active_job is not None and active_job.active and active_job.key == cache_key: job = active_job  # clicked again while it runs
+                    else:
+                        if active_job is not None: active_job.cancel()  # superseded by this request
+                        # Identical requests already queued or running (from any session) are joined, not repeated
+                        job = get_job_manager().submit(cache_key, pipeline.summarize_job, url, model_name, chain_type, max_tokens, llm, cache, get_chunk_memo_store(),
+                                                       map_executor.get_rate_limiter(model_name, GROQ_RPM, GROQ_TPM), MAP_CONCURRENCY, REDUCE_FAN_IN)
+                    st.session_state["job"] = {"id": job.id, "url": url, "model": model_name, "chain_type": chain_type, "max_tokens": max_tokens}
+                    st.button("✖ Cancel", key="cancel_job")
+                    follow_job(job, progress_bar, st.session_state["job"])
+                    del st.session_state["job"]
                 except Exception as e: st.markdown(f"""<div class="error-message"><span>❌ Unexpected setup error: {e}</span></div>""", unsafe_allow_html=True)
+    elif active_job is not None:
+        # A rerun (widget change, Cancel click) interrupted the run that was following this session's job
+        request = st.session_state["job"]
+        with st.container():
+            progress_bar = st.empty()
+            if st.button("✖ Cancel", key="cancel_job"):
+                cancelled = active_job.cancel()
+                render_progress(progress_bar, "info", "✖ Summarization cancelled" if cancelled else "✖ Stopped following (other requests still need this summary)", 100)
+                del st.session_state["job"]
+            else:
+                follow_job(active_job, progress_bar, request)
+                del st.session_state["job"]
@@ -0,0 +1,228 @@
+"""Headless batch summarizer.
+
+    python batch.py urls.txt -o results.jsonl --fetch-workers 8 --summarize-workers 4
+    cat urls.txt | python batch.py - -o results.jsonl
+
+URLs flow through fetch+split -> summarize stages connected by bounded queues.
+Each finished item is appended to the JSONL output immediately, so re-running the
+same command after a crash skips everything already written.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import config
+import map_executor
+import pipeline
+import summarizer
+import token_budget
+import tracing
+
+logger = logging.getLogger("batch")
+
+_DONE = object()
+
+
+def read_urls(path):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        seen, urls = set(), []
+        for line in stream:
+            url = line.strip()
+            if url and not url.startswith("#") and url not in seen:
+                seen.add(url); urls.append(url)
+        return urls
+    finally:
+        if stream is not sys.stdin: stream.close()
+
+
+def run_key(url, model, chain_type, max_tokens):
+    return url, model, chain_type, max_tokens
+
+
+def completed_runs(output_path, retry_errors=False):
+    """run_key()s already recorded in a previous (possibly interrupted) run, so other settings still re-run a URL."""
+    done = set()
+    if not os.path.exists(output_path): return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try: record = json.loads(line)
+            except ValueError: continue  # torn last line from a crash
+            if record.get("status") == "ok" or not retry_errors: done.add(run_key(record.get("url"), record.get("model"), record.get("chain_type"), record.get("max_tokens")))
+    return done
+
+
+class BatchRunner:
+    def __init__(self, args):
+        self.args = args
+        self.templates = self.map_template, self.combine_template, self.refine_template = pipeline.build_templates(args.max_tokens)
+        self.map_prompt, self.combine_prompt, self.refine_prompt = pipeline.build_prompts(*self.templates)
+        self.llm = pipeline.make_llm(args.model, args.max_tokens, args.api_key)
+        self.reduce_tokens = token_budget.reduce_token_budget(args.model, args.max_tokens, self.combine_template)
+        self.limiter = map_executor.get_rate_limiter(args.model, args.rpm, args.tpm)
+        self.cache = None if args.no_cache else pipeline.open_summary_cache()
+        self.memo_store = pipeline.open_chunk_memo()
+        self.fetch_q = queue.Queue(maxsize=args.queue_size)
+        self.summarize_q = queue.Queue(maxsize=args.queue_size)
+        self.result_q = queue.Queue(maxsize=args.queue_size)
+        self.written = self.errors = 0
+        self.aborted = threading.Event()  # set when the output cannot be written; the rest of the run is skipped
+
+    def _error(self, item, stage, e):
+        item.pop("_work", None)
+        item.update(status="error", error=f"{stage}: {e}")
+        self.result_q.put(item)
+
+    def _fetch_worker(self):
+        while True:
+            item = self.fetch_q.get()
+            if item is _DONE: return
+            if self.aborted.is_set(): continue
+            # Anything that escapes a stage still ends in a result record, and the worker keeps going
+            try: self._fetch_item(item)
+            except Exception as e: self._error(item, item.pop("_stage", "fetch"), e)
+
+    def _fetch_item(self, item):
+        url, timings = item["url"], item["timings"]
+        started = time.time()
+        item["_stage"] = "fetch"
+        source, key = pipeline.cache_identity(url, self.args.model, self.args.chain_type, self.args.max_tokens, *self.templates)
+        item.update(source=source, cache_key=key)
+        item["_trace"] = trace = tracing.Trace("request", url=url)
+        cached = docs = None
+        if self.cache:
+            with tracing.activate(trace): cached = pipeline.lookup_summary(self.cache, key)
+        if cached and not pipeline.is_youtube_url(url):  # the page may have changed since it was summarized
+            try:
+                with tracing.activate(trace): docs = pipeline.load_documents(url)
+            except Exception as e: logger.warning("Could not re-check %s (%s); using the cached summary", url, e)
+            else:
+                if not pipeline.is_current(cached, url, docs): cached = None
+        if cached:
+            timings["cache"] = round(time.time() - started, 4)
+            item.pop("_stage")
+            item.update(status="ok", summary=cached["summary"], cached=True)
+            self.result_q.put(item); return
+        if docs is None:
+            with tracing.activate(trace): docs = pipeline.load_documents(url)
+        digest = None if pipeline.is_youtube_url(url) else pipeline.source_digest(docs)
+        timings["fetch"] = round(time.time() - started, 4)
+        split_started, item["_stage"] = time.time(), "split"
+        with tracing.activate(trace):
+            docs, reduction = pipeline.prereduce_documents(docs, self.args.model, transcript=pipeline.is_youtube_url(url))
+            split_docs, _, est_tokens, count_tokens = pipeline.split_documents(docs, self.args.model, self.args.chain_type, self.args.max_tokens, self.map_template, self.refine_template)
+        timings["split"] = round(time.time() - split_started, 4)
+        item.pop("_stage")
+        item.update(chunks=len(split_docs), est_tokens=est_tokens, characters=sum(len(d.page_content) for d in docs), chars_removed=reduction["chars_removed"], est_tokens_removed=reduction["est_tokens_removed"])
+        item["_work"] = (split_docs, count_tokens, digest)
+        queued = time.time()
+        self.summarize_q.put(item)
+        timings["queue_wait"] = round(time.time() - queued, 4)
+
+    def _summarize_worker(self):
+        while True:
+            item = self.summarize_q.get()
+            if item is _DONE: return
+            if self.aborted.is_set(): continue
+            try: self._summarize_item(item)
+            except Exception as e: self._error(item, "summarize", e)
+
+    def _summarize_item(self, item):
+        split_docs, count_tokens, digest = item.pop("_work")
+        started = time.time()
+        memo = pipeline.memo_scope(self.memo_store, self.args.model, self.args.max_tokens, item["source"]) if self.memo_store else None
+        with tracing.activate(item["_trace"]):
+            summary = summarizer.summarize_documents(self.llm, self.args.chain_type, split_docs, self.map_prompt, self.combine_prompt, self.refine_prompt, limiter=self.limiter, concurrency=self.args.map_concurrency, max_tokens=self.args.max_tokens, count_tokens=count_tokens, memo=memo, reduce_tokens=self.reduce_tokens, fan_in=self.args.fan_in)
+        item["timings"]["summarize"] = round(time.time() - started, 4)
+        item.update(status="ok", summary=summary, cached=False)
+        if memo: item.update(memo_hits=memo.hits, memo_misses=memo.misses)
+        if self.cache: pipeline.store_summary(self.cache, item["cache_key"], item["source"], summary, {"model": self.args.model, "chain_type": self.args.chain_type, "max_tokens": self.args.max_tokens, "chunks": item["chunks"], "seconds": item["timings"]["summarize"], "digest": digest})
+        self.result_q.put(item)
+
+    def _writer(self, out):
+        while True:
+            item = self.result_q.get()
+            if item is _DONE: return
+            if self.aborted.is_set(): continue  # keep draining so no worker blocks on a full queue
+            try: self._write(out, item)
+            except Exception as e:
+                logger.error("Cannot write %s (%s); stopping the run", self.args.output, e)
+                self.aborted.set()
+
+    def _write(self, out, item):
+        item.pop("cache_key", None)
+        item["timings"]["total"] = round(time.time() - item.pop("_started"), 4)
+        trace = item.pop("_trace", None)
+        if trace: item["spans"] = trace.finish().breakdown()
+        item["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
+        out.write(json.dumps(item, ensure_ascii=False) + "\n"); out.flush()
+        os.fsync(out.fileno())
+        self.written += 1
+        if item["status"] != "ok":
+            self.errors += 1; logger.warning("%s failed: %s", item["url"], item["error"])
+        else: logger.info("%s done in %.2fs", item["url"], item["timings"]["total"])
+
+    def run(self, urls):
+        fetchers = [threading.Thread(target=self._fetch_worker, daemon=True) for _ in range(self.args.fetch_workers)]
+        summarizers = [threading.Thread(target=self._summarize_worker, daemon=True) for _ in range(self.args.summarize_workers)]
+        with open(self.args.output, "a", encoding="utf-8") as out:
+            writer = threading.Thread(target=self._writer, args=(out,), daemon=True)
+            for t in fetchers + summarizers + [writer]: t.start()
+            for url in urls:
+                if self.aborted.is_set(): break
+                self.fetch_q.put({"url": url, "model": self.args.model, "chain_type": self.args.chain_type, "max_tokens": self.args.max_tokens, "timings": {}, "_started": time.time()})
+            for _ in fetchers: self.fetch_q.put(_DONE)
+            for t in fetchers: t.join()
+            for _ in summarizers: self.summarize_q.put(_DONE)
+            for t in summarizers: t.join()
+            self.result_q.put(_DONE)
+            writer.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a list of YouTube/website URLs into JSONL.")
+    parser.add_argument("input", help="File with one URL per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="summaries.jsonl", help="JSONL output (appended to; used to resume)")
+    parser.add_argument("--model", default="gemma-7b-it", choices=["gemma-7b-it", "llama3-8b-8192", "mixtral-8x7b-32768"])
+    parser.add_argument("--chain-type", default="map_reduce", choices=["map_reduce", "stuff", "refine"])
+    parser.add_argument("--max-tokens", type=int, default=600)
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--summarize-workers", type=int, default=4)
+    parser.add_argument("--map-concurrency", type=int, default=config.MAP_CONCURRENCY)
+    parser.add_argument("--fan-in", type=int, default=config.REDUCE_FAN_IN, help="Most summaries combined by one reduce step")
+    parser.add_argument("--queue-size", type=int, default=16, help="Bound on items waiting between stages")
+    parser.add_argument("--rpm", type=int, default=config.GROQ_RPM)
+    parser.add_argument("--tpm", type=int, default=config.GROQ_TPM)
+    parser.add_argument("--api-key", default=config.GROQ_API_KEY)
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run URLs that failed in a previous run")
+    parser.add_argument("--no-cache", action="store_true", help="Re-summarize instead of reusing cached summaries (unchanged chunks still come from the chunk memo)")
+    parser.add_argument("--metrics-port", type=int, default=config.METRICS_PORT, help="Serve Prometheus /metrics on this port while running")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not config.is_api_key_plausible(args.api_key):
+        logger.error("GROQ_API_KEY is missing or invalid"); return 2
+    urls = read_urls(args.input)
+    done = completed_runs(args.output, args.retry_errors)
+    pending = [u for u in urls if run_key(u, args.model, args.chain_type, args.max_tokens) not in done]
+    logger.info("%d URLs, %d already done, %d to process", len(urls), len(urls) - len(pending), len(pending))
+    if args.metrics_port: tracing.start_metrics_server(args.metrics_port)
+    runner = BatchRunner(args)
+    started = time.time()
+    runner.run(pending)
+    elapsed = time.time() - started
+    logger.info("Finished %d items (%d errors) in %.1fs (%.2f items/min)", runner.written, runner.errors, elapsed, runner.written * 60 / elapsed if elapsed else 0)
+    return 1 if runner.aborted.is_set() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
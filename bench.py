@@ -0,0 +1,391 @@
+"""Offline benchmark of the summarization pipeline.
+
+    python bench.py                                   # all chain types over the fixture corpus
+    python bench.py --chain-types map_reduce --reps 5 --save-baseline main
+    python bench.py --compare main                    # exit 1 if a configuration regressed
+    python bench.py --record https://youtu.be/ID https://example.com/post   # add real fixtures
+
+Each run goes through pipeline.summarize_job (the app's job body) against the corpus in
+benchmarks/corpus, so nothing touches the network: transcript/page loading is served from the
+fixtures and the LLM is a deterministic local stand-in with configurable latency, token rate and
+429s. Reports end-to-end latency percentiles, LLM calls, tokens, retries and peak memory per
+configuration; baselines are JSON files in benchmarks/baselines.
+"""
+import os
+
+# Keep benchmark runs out of the app's metrics files
+for _var in ("TRACE_LOG_PATH", "METRICS_PROM_PATH", "METRICS_JSONL_PATH"): os.environ.setdefault(_var, "")
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+import config
+import jobs
+import map_executor
+import pipeline
+import sources
+import token_budget
+import tracing
+import web_extract
+
+logger = logging.getLogger("bench")
+
+# Count tokens with each model's characters-per-token estimate (an empty tokenizer repo), so results never
+# depend on which Hugging Face tokenizers this machine can download or already has cached
+config.TOKENIZER_REPOS.update(dict.fromkeys(token_budget.MODEL_REGISTRY, ""))
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+_VOCAB = ("data model system time people work point case result change question value process number way part "
+          "problem example idea research team user design test cost rate risk level form method market network "
+          "signal memory budget layer cache query batch stream review policy energy climate city water health "
+          "growth price demand supply history theory language image video sound learning training error report "
+          "make show find build give take keep move turn start need seem help grow lead run hold bring explain "
+          "important large small early recent simple common clear strong different possible likely general local "
+          "really actually basically so and but because which when while although then also often usually").split()
+
+
+# --- Synthetic fixtures (seeded, so every machine generates the same corpus) ---
+
+def _words(rng, n):
+    return [rng.choice(_VOCAB) for _ in range(n)]
+
+
+def _sentence(rng, lo=6, hi=18):
+    words = _words(rng, rng.randint(lo, hi))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def synthetic_transcript(spec):
+    """Auto-caption style segments: short, unpunctuated, with music cues and a repeated sponsor read."""
+    rng = random.Random(spec["seed"])
+    segments, words, start = [], 0, 0.0
+    sponsor = "this video is sponsored by " + " ".join(_words(rng, 12))
+    while words < spec["words"]:
+        roll = rng.random()
+        if roll < 0.01: text = "[Music]"
+        elif roll < 0.015: text = sponsor
+        elif roll < 0.02: text = "don't forget to subscribe and hit the bell"
+        else: text = " ".join(_words(rng, rng.randint(4, 11)))
+        duration = round(0.3 * len(text.split()) + rng.random(), 2)
+        segments.append({"text": text, "start": round(start, 2), "duration": duration})
+        words += len(text.split()); start += duration
+    return segments
+
+
+def synthetic_page(spec):
+    """An article page with navigation, cookie banner, sidebar and footer around the main text."""
+    rng = random.Random(spec["seed"])
+    nav = "".join(f'<li><a href="/{w}">{w.title()}</a></li>' for w in _words(rng, 12))
+    related = "".join(f'<li><a href="/post/{i}">{_sentence(rng, 4, 8)}</a></li>' for i in range(10))
+    body, words, paragraphs = [], 0, 0
+    while words < spec["words"]:
+        if paragraphs % 6 == 0: body.append(f"<h2>{_sentence(rng, 3, 7)}</h2>")
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+        body.append(f"<p>{paragraph}</p>")
+        if rng.random() < 0.1: body.append('<div class="share-buttons"><a href="#">Share on Facebook</a> <a href="#">Share on Twitter</a></div>')
+        words += len(paragraph.split()); paragraphs += 1
+    title = _sentence(rng, 4, 9)
+    return (f"<html><head><title>{title}</title><style>body {{ margin: 0 }}</style></head><body>"
+            f'<header class="masthead"><nav class="menu"><ul>{nav}</ul></nav></header>'
+            '<div class="cookie-banner">We use cookies to improve your experience. Accept all cookies</div>'
+            f'<main><article class="post-content"><h1>{title}</h1>{"".join(body)}</article>'
+            f'<aside class="sidebar"><h3>Related posts</h3><ul>{related}</ul></aside></main>'
+            f'<footer class="footer"><p>© 2024 Example Media. All rights reserved.</p><ul>{nav}</ul></footer>'
+            "<script>window.analytics = {};</script></body></html>")
+
+
+def load_corpus(corpus_dir=CORPUS_DIR, only=None):
+    """Corpus items with their `segments` (transcripts) or `html` (pages) loaded or generated."""
+    with open(os.path.join(corpus_dir, "manifest.json"), encoding="utf-8") as f: manifest = json.load(f)
+    items = []
+    for entry in manifest["items"]:
+        if only and entry["id"] not in only: continue
+        item = dict(entry)
+        if "file" in entry:
+            with open(os.path.join(corpus_dir, entry["file"]), encoding="utf-8") as f:
+                if entry["kind"] == "transcript": item["segments"] = json.load(f)
+                else: item["html"] = f.read()
+        elif entry["kind"] == "transcript": item["segments"] = synthetic_transcript(entry["synthetic"])
+        else: item["html"] = synthetic_page(entry["synthetic"])
+        items.append(item)
+    return items
+
+
+@contextmanager
+def offline_sources(items, fetch_latency=0.0):
+    """Serve transcript and page loading in `pipeline` from the corpus instead of the network."""
+    from langchain.schema import Document
+    by_video = {sources.extract_youtube_id(i["url"]): i for i in items if i["kind"] == "transcript"}
+    by_url = {i["url"]: i for i in items if i["kind"] == "html"}
+
+    def fetch_transcript_segments(video_id, notify=sources.log_message):
+        time.sleep(fetch_latency)
+        item = by_video.get(video_id)
+        if item is None: notify("error", f"❌ No fixture for video {video_id}"); return None
+        notify("success", "✅ Found English transcript!")
+        return item["segments"]
+
+    def load_website(url):
+        time.sleep(fetch_latency)
+        with tracing.span("web.fetch", url=url):
+            title, text = web_extract.extract_main_text(by_url[url]["html"])
+        return [Document(page_content=text, metadata={"source": url, "title": title, "extractor": "fast", "http_status": "fixture"})]
+
+    saved = pipeline.fetch_transcript_segments, pipeline.load_website
+    pipeline.fetch_transcript_segments, pipeline.load_website = fetch_transcript_segments, load_website
+    try: yield
+    finally: pipeline.fetch_transcript_segments, pipeline.load_website = saved
+
+
+# --- Local LLM stand-in ---
+
+class SimulatedRateLimit(Exception):
+    """Looks like a Groq 429 to map_executor.is_rate_limit_error, including a Retry-After header."""
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Error code: 429 - rate limit reached (simulated)")
+        self.response = SimpleNamespace(status_code=429, headers={"retry-after": str(retry_after)})
+
+
+class BenchChatModel(BaseChatModel):
+    """Deterministic fake chat model: output depends only on the prompt, timing on the settings.
+
+    A prompt's completion has `output_ratio` of its tokens (capped at `max_output_tokens`), arrives
+    after `latency_s` and then at `tokens_per_s`. Each attempt at a prompt fails with a 429 with
+    probability `rate_limit_p`, decided by hashing the prompt and attempt number, so retries are
+    the same on every run regardless of thread scheduling.
+    """
+
+    latency_s: float = 0.1
+    tokens_per_s: float = 800.0
+    output_ratio: float = 0.15
+    max_output_tokens: int = 600
+    rate_limit_p: float = 0.0
+    retry_after_s: float = 0.05
+    seed: int = 0
+    _attempts: dict = PrivateAttr(default_factory=dict)
+    _lock: object = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "bench-fake"
+
+    def _digest(self, *parts):
+        return hashlib.blake2b("\x00".join(map(str, (self.seed, *parts))).encode("utf-8"), digest_size=16).digest()
+
+    def _prompt(self, messages):
+        text = messages[-1].content
+        key = self._digest(text).hex()
+        with self._lock:
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        if self.rate_limit_p and int.from_bytes(self._digest(key, attempt)[:8], "big") / 2 ** 64 < self.rate_limit_p:
+            raise SimulatedRateLimit(self.retry_after_s)
+        prompt_tokens = map_executor.estimate_tokens(text)
+        n = max(16, min(self.max_output_tokens, int(prompt_tokens * self.output_ratio)))
+        words = [_VOCAB[b % len(_VOCAB)] for i in range(0, n, 16) for b in self._digest(key, "out", i)][:n]
+        return prompt_tokens, n, words
+
+    def _usage(self, prompt_tokens, n):
+        return {"input_tokens": prompt_tokens, "output_tokens": n, "total_tokens": prompt_tokens + n}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt_tokens, n, words = self._prompt(messages)
+        time.sleep(self.latency_s + n / self.tokens_per_s)
+        message = AIMessage(content=" ".join(words), usage_metadata=self._usage(prompt_tokens, n))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt_tokens, n, words = self._prompt(messages)
+        time.sleep(self.latency_s)
+        for i in range(0, len(words), 8):
+            time.sleep(len(words[i:i + 8]) / self.tokens_per_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=(" " if i else "") + " ".join(words[i:i + 8])))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt_tokens, n)))
+
+
+# --- Runner ---
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run_once(item, conf, args, measure_memory=False):
+    llm = BenchChatModel(latency_s=args.latency * args.time_scale, tokens_per_s=args.tokens_per_s / max(args.time_scale, 1e-9),
+                         output_ratio=args.output_ratio, max_output_tokens=conf["max_tokens"], rate_limit_p=args.rate_limit_p,
+                         retry_after_s=args.retry_after * args.time_scale, seed=args.seed)
+    limiter = map_executor.RateLimiter(args.rpm, args.tpm) if args.rpm and args.tpm else None
+    job = jobs.Job(item["id"])
+    if measure_memory: tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = pipeline.summarize_job(job, item["url"], conf["model"], conf["chain_type"], conf["max_tokens"], llm, limiter=limiter,
+                                        concurrency=conf["concurrency"], fan_in=args.fan_in)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        if measure_memory: tracemalloc.stop()
+    rows = job.state["trace"].breakdown()
+    llm_rows = [r for r in rows if r["stage"].startswith("llm.")]
+    return {"seconds": seconds, "chunks": result["chunks"], "llm_calls": sum(r["calls"] for r in llm_rows),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in llm_rows), "completion_tokens": sum(r["completion_tokens"] for r in llm_rows),
+            "retries": sum(r["retries"] for r in rows), "peak_mem_mb": round(peak / 2 ** 20, 2) if peak is not None else None}
+
+
+def run_config(items, conf, args):
+    """Warm-up run per item (also the one that measures peak memory), then `reps` timed runs."""
+    latencies, per_item = [], {}
+    for item in items:
+        first = run_once(item, conf, args, measure_memory=not args.no_memory)
+        timed = [run_once(item, conf, args) for _ in range(args.reps)]
+        latencies += [r["seconds"] for r in timed]
+        per_item[item["id"]] = {**{k: first[k] for k in ("chunks", "llm_calls", "prompt_tokens", "completion_tokens", "retries", "peak_mem_mb")},
+                                "p50_s": round(_percentile([r["seconds"] for r in timed], 0.5), 4)}
+        logger.debug("%s %s: %s", conf["name"], item["id"], per_item[item["id"]])
+    totals = {k: sum(i[k] for i in per_item.values()) for k in ("chunks", "llm_calls", "prompt_tokens", "completion_tokens", "retries")}
+    peaks = [i["peak_mem_mb"] for i in per_item.values() if i["peak_mem_mb"] is not None]
+    return {"runs": len(latencies), **{f"p{int(q * 100)}_s": round(_percentile(latencies, q), 4) for q in (0.5, 0.95, 0.99)},
+            "max_s": round(max(latencies), 4), **totals, "peak_mem_mb": max(peaks) if peaks else None, "items": per_item}
+
+
+def configurations(args):
+    for model, chain_type, max_tokens, concurrency in itertools.product(args.models, args.chain_types, args.max_tokens, args.concurrency):
+        yield {"name": f"{model}/{chain_type}/{max_tokens}/c{concurrency}", "model": model, "chain_type": chain_type, "max_tokens": max_tokens, "concurrency": concurrency}
+
+
+def print_report(results):
+    header = f"{'configuration':<40} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'calls':>6} {'prompt tok':>11} {'compl tok':>10} {'retries':>7} {'peak MB':>8}"
+    print(header); print("-" * len(header))
+    for name, r in results.items():
+        peak = f"{r['peak_mem_mb']:.1f}" if r["peak_mem_mb"] is not None else "-"
+        print(f"{name:<40} {r['p50_s']:>8.3f} {r['p95_s']:>8.3f} {r['max_s']:>8.3f} {r['llm_calls']:>6} {r['prompt_tokens']:>11,} {r['completion_tokens']:>10,} {r['retries']:>7} {peak:>8}")
+
+
+def compare(results, baseline, latency_tolerance, memory_tolerance):
+    """Lines describing regressions against `baseline` (empty if none)."""
+    problems = []
+    for name, r in results.items():
+        base = baseline["configs"].get(name)
+        if base is None: continue
+        for key in ("p50_s", "p95_s"):
+            if base[key] and r[key] > base[key] * (1 + latency_tolerance):
+                problems.append(f"{name}: {key} {base[key]:.3f} -> {r[key]:.3f} (+{r[key] / base[key] - 1:.0%})")
+        for key in ("llm_calls", "prompt_tokens", "completion_tokens"):  # deterministic, so any growth is real
+            if r[key] > base[key]: problems.append(f"{name}: {key} {base[key]:,} -> {r[key]:,}")
+        if base.get("peak_mem_mb") and r["peak_mem_mb"] and r["peak_mem_mb"] > base["peak_mem_mb"] * (1 + memory_tolerance):
+            problems.append(f"{name}: peak_mem_mb {base['peak_mem_mb']:.1f} -> {r['peak_mem_mb']:.1f}")
+    return problems
+
+
+def record(urls, corpus_dir=CORPUS_DIR):
+    """Fetch real transcripts/pages once and add them to the corpus manifest as fixtures."""
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    with open(manifest_path, encoding="utf-8") as f: manifest = json.load(f)
+    for url in urls:
+        if sources.is_youtube_url(url):
+            video_id = sources.extract_youtube_id(url)
+            segments = sources.fetch_transcript_segments(video_id) if video_id else None
+            if not segments: logger.error("No transcript for %s", url); continue
+            item_id, kind, rel = f"yt-{video_id}", "transcript", os.path.join("transcripts", f"yt-{video_id}.json")
+            payload = json.dumps([{"text": t["text"]} for t in segments], ensure_ascii=False)
+        else:
+            resp = web_extract.get_session().get(url, timeout=web_extract.REQUEST_TIMEOUT)
+            resp.raise_for_status()
+            item_id = "web-" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+            kind, rel = "html", os.path.join("pages", f"{item_id}.html")
+            payload = web_extract._decode(resp.content, web_extract.declared_charset(resp.headers.get("Content-Type")))
+        os.makedirs(os.path.dirname(os.path.join(corpus_dir, rel)), exist_ok=True)
+        with open(os.path.join(corpus_dir, rel), "w", encoding="utf-8") as f: f.write(payload)
+        manifest["items"] = [i for i in manifest["items"] if i["id"] != item_id] + [{"id": item_id, "url": url, "kind": kind, "file": rel.replace(os.sep, "/")}]
+        logger.info("Recorded %s as %s", url, rel)
+    with open(manifest_path, "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2); f.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the summarization pipeline offline against the fixture corpus.")
+    parser.add_argument("--items", nargs="*", help="Corpus item ids to run (default: all)")
+    parser.add_argument("--models", nargs="+", default=["gemma-7b-it"], choices=["gemma-7b-it", "llama3-8b-8192", "mixtral-8x7b-32768"])
+    parser.add_argument("--chain-types", nargs="+", default=["map_reduce", "stuff", "refine"], choices=["map_reduce", "stuff", "refine"])
+    parser.add_argument("--max-tokens", nargs="+", type=int, default=[600])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[config.MAP_CONCURRENCY])
+    parser.add_argument("--fan-in", type=int, default=config.REDUCE_FAN_IN)
+    parser.add_argument("--reps", type=int, default=3, help="Timed runs per item after the warm-up run")
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated time to first token (s)")
+    parser.add_argument("--tokens-per-s", type=float, default=800.0, help="Simulated generation speed")
+    parser.add_argument("--output-ratio", type=float, default=0.15, help="Completion tokens per prompt token (capped at max tokens)")
+    parser.add_argument("--rate-limit-p", type=float, default=0.0, help="Probability that an LLM attempt gets a 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After sent with simulated 429s (s)")
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="Simulated transcript/page download time (s)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiply every simulated delay (0 measures pipeline CPU only)")
+    parser.add_argument("--rpm", type=int, default=0, help="Also apply a client-side RateLimiter with these quotas")
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory measurement")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against a saved baseline; exit 1 on regression")
+    parser.add_argument("--latency-tolerance", type=float, default=0.15)
+    parser.add_argument("--memory-tolerance", type=float, default=0.20)
+    parser.add_argument("--record", nargs="+", metavar="URL", help="Record real transcripts/pages into the corpus and exit")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    if args.record:
+        logging.getLogger().setLevel(logging.INFO)
+        record(args.record); return 0
+    items = load_corpus(only=args.items)
+    if not items:
+        logger.error("No corpus items selected"); return 2
+    results = {}
+    with offline_sources(items, args.fetch_latency * args.time_scale):
+        # One unmeasured run first, so lazy imports and compiled regexes do not count as the first item's memory
+        run_once(items[0], next(configurations(args)), argparse.Namespace(**{**vars(args), "time_scale": 0.0, "rate_limit_p": 0.0}))
+        for conf in configurations(args):
+            results[conf["name"]] = run_config(items, conf, args)
+    print_report(results)
+
+    settings = {k: getattr(args, k) for k in ("latency", "tokens_per_s", "output_ratio", "rate_limit_p", "retry_after", "fetch_latency", "time_scale", "rpm", "tpm", "seed", "fan_in", "reps")}
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(),
+                       "items": [i["id"] for i in items], "settings": settings, "configs": results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline {path}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), encoding="utf-8") as f: baseline = json.load(f)
+        if baseline.get("settings") != settings: print("Note: baseline was recorded with different settings:", baseline.get("settings"))
+        problems = compare(results, baseline, args.latency_tolerance, args.memory_tolerance)
+        for line in problems: print("REGRESSION", line)
+        if problems: return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Memoized map/reduce nodes so a changed document only re-runs the parts that changed.
+
+Map nodes are keyed by the chunk text, reduce nodes by the keys of their children (a Merkle
+tree), both scoped to model, output budget and prompt. The last tree built for each source is
+stored too, which is what lets a re-summarization report how much of it was reused.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkMemoStore:
+    def __init__(self, path=config.CHUNK_MEMO_PATH, ttl_seconds=config.CHUNK_MEMO_TTL_HOURS * 3600, max_entries=config.CHUNK_MEMO_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (key TEXT PRIMARY KEY, output TEXT, created_at REAL, last_access REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS nodes_lru ON nodes(last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS trees (tree_id TEXT PRIMARY KEY, tree TEXT, updated_at REAL)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT output, created_at FROM nodes WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds): return None
+            self._conn.execute("UPDATE nodes SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, output):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)", (key, output, now, now))
+            self._writes += 1
+            if self._writes % 500 == 0: self._prune(now)
+
+    def _prune(self, now):
+        if self.ttl_seconds: self._conn.execute("DELETE FROM nodes WHERE created_at < ?", (now - self.ttl_seconds,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0] - self.max_entries
+        if excess > 0: self._conn.execute("DELETE FROM nodes WHERE key IN (SELECT key FROM nodes ORDER BY last_access ASC LIMIT ?)", (excess,))
+
+    def save_tree(self, tree_id, tree):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO trees VALUES (?, ?, ?)", (tree_id, json.dumps(tree), time.time()))
+
+    def load_tree(self, tree_id):
+        with self._lock:
+            row = self._conn.execute("SELECT tree FROM trees WHERE tree_id = ?", (tree_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class MemoScope:
+    """One summarization's view of the store: fixes the model/output-budget namespace and the tree id.
+
+    Store errors (e.g. the database locked by another process) are logged and never fail the
+    summarization: a failed read is a miss, a failed write just leaves that node uncached.
+    """
+
+    def __init__(self, store, namespace, tree_id=None):
+        self.store = store
+        self.namespace = namespace
+        self.tree_id = tree_id
+        self.hits = self.misses = 0
+        self.tree = {"leaves": [], "levels": []}
+
+    def key(self, kind, template, *parts):
+        h = hashlib.sha256()
+        for part in (kind, self.namespace, template, *parts):
+            h.update(part.encode("utf-8")); h.update(b"\x00")
+        return h.hexdigest()
+
+    def get(self, key):
+        try: output = self.store.get(key)
+        except Exception as e:
+            logger.warning("Chunk memo lookup failed: %s", e); output = None
+        if output is None: self.misses += 1
+        else: self.hits += 1
+        tracing.record_cache("chunk_memo", output is not None)
+        return output
+
+    def set(self, key, output):
+        try: self.store.set(key, output)
+        except Exception as e: logger.warning("Chunk memo write failed: %s", e)
+
+    def save_tree(self):
+        """Persist the tree just built; returns the share of its nodes that existed in the previous version."""
+        if not self.tree_id: return None
+        try:
+            previous = self.store.load_tree(self.tree_id)
+            self.store.save_tree(self.tree_id, self.tree)
+        except Exception as e:
+            logger.warning("Chunk memo tree not saved: %s", e); return None
+        if not previous: return None
+        old = set(previous["leaves"]).union(*map(set, previous["levels"]))
+        new = [k for k in self.tree["leaves"] + [k for level in self.tree["levels"] for k in level]]
+        return sum(k in old for k in new) / len(new) if new else None
@@ -0,0 +1,134 @@
+"""Content-defined chunking.
+
+Chunk boundaries are picked from the text itself (a hash of the sentence or word group being
+added) rather than from running offsets, so inserting or editing a paragraph only changes the
+chunks around the edit; the chunks after it re-align with the previous version and their
+memoized summaries can be reused.
+"""
+import re
+import zlib
+
+_UNIT_END = re.compile(r"\n\s*\n|\n|(?<=[.!?。！？])\s+")
+_WORD = re.compile(r"\S+\s*")
+
+MAX_UNIT_WORDS = 64   # longer sentences (or unpunctuated transcripts) are cut into word groups
+MIN_GROUP_WORDS = 8
+GROUP_DIVISOR = 12    # ~1 in 12 words ends a word group
+MIN_FILL = 0.75       # a chunk may end early only once it is this full
+CUT_DIVISOR = 2       # ...and then after ~1 in 2 units
+
+
+def _hash(text):
+    return zlib.crc32(" ".join(text.lower().split()).encode("utf-8"))
+
+
+def _word_groups(text, start, end):
+    group_start, words = start, 0
+    for m in _WORD.finditer(text, start, end):
+        words += 1
+        if words >= MAX_UNIT_WORDS or (words >= MIN_GROUP_WORDS and _hash(m.group()) % GROUP_DIVISOR == 0):
+            yield group_start, m.end()
+            group_start, words = m.end(), 0
+    if group_start < end: yield group_start, end
+
+
+def _scan(text, continuing=False):
+    """(start, end, grouped) units of `text`; `continuing` means it starts inside an over-long unit."""
+    start = 0
+    if continuing:
+        m = _UNIT_END.search(text)
+        end = m.end() if m else len(text)
+        for s, e in _word_groups(text, 0, end): yield s, e, True
+        start = end
+    for end in [m.end() for m in _UNIT_END.finditer(text, start)] + [len(text)]:
+        if end <= start: continue
+        if len(text[start:end].split()) > MAX_UNIT_WORDS:
+            for s, e in _word_groups(text, start, end): yield s, e, True
+        else: yield start, end, False
+        start = end
+
+
+def iter_units(text):
+    """(start, end) spans of sentences/lines, with over-long ones cut at content-defined word boundaries."""
+    for start, end, _ in _scan(text): yield start, end
+
+
+class UnitStream:
+    """iter_units over text that arrives in pieces: yields the same units as iter_units on the joined text.
+
+    The last unit seen is held back until more text (or close()) shows where it really ends.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._continuing = False
+
+    def feed(self, text):
+        buf, held = self._buf + text, None
+        for unit in _scan(buf, self._continuing):
+            if held: yield buf[held[0]:held[1]]
+            held = unit
+        if held: self._buf, self._continuing = buf[held[0]:], held[2]
+        else: self._buf = buf
+
+    def close(self):
+        if self._buf:
+            for start, end, _ in _scan(self._buf, self._continuing): yield self._buf[start:end]
+        self._buf, self._continuing = "", False
+
+
+class ChunkAccumulator:
+    """Content-defined chunk packing fed incrementally, with running totals of what was emitted."""
+
+    def __init__(self, chunk_tokens, count_tokens):
+        self.chunk_tokens = chunk_tokens
+        self.count_tokens = count_tokens
+        self.units = UnitStream()
+        self._parts, self._fill = [], 0
+        self.chunks = self.chars = self.words = self.tokens = 0
+
+    def _emit(self):
+        chunk = "".join(self._parts).strip()
+        self.tokens += self._fill
+        self._parts, self._fill = [], 0
+        if chunk:
+            self.chunks += 1; self.chars += len(chunk); self.words += len(chunk.split())
+            yield chunk
+
+    def _add(self, units):
+        for unit in units:
+            if not unit.strip():
+                if self._parts: self._parts.append(unit)
+                continue
+            n = self.count_tokens(unit)
+            if self._parts and self._fill + n > self.chunk_tokens: yield from self._emit()
+            self._parts.append(unit); self._fill += n
+            if self._fill >= self.chunk_tokens * MIN_FILL and _hash(unit) % CUT_DIVISOR == 0: yield from self._emit()
+
+    def feed(self, text):
+        """Chunks completed by `text`."""
+        return self._add(self.units.feed(text))
+
+    def close(self):
+        yield from self._add(self.units.close())
+        if self._parts: yield from self._emit()
+
+
+def split_text(text, chunk_tokens, count_tokens):
+    acc = ChunkAccumulator(chunk_tokens, count_tokens)
+    return [*acc.feed(text), *acc.close()]
+
+
+class ContentDefinedSplitter:
+    """Drop-in for the `split_documents` part of LangChain's text splitters."""
+
+    def __init__(self, chunk_tokens, count_tokens):
+        self.chunk_tokens = chunk_tokens
+        self.count_tokens = count_tokens
+
+    def split_text(self, text):
+        return split_text(text, self.chunk_tokens, self.count_tokens)
+
+    def split_documents(self, docs):
+        from langchain.schema import Document
+        return [Document(page_content=chunk, metadata=dict(doc.metadata)) for doc in docs for chunk in self.split_text(doc.page_content)]
@@ -0,0 +1,72 @@
+import os
+
+# --- IMPORTANT ---
+# Replace with your actual Groq API key before deployment if needed (or set GROQ_API_KEY in the environment)
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "YOUR_GROQ_API_KEY_HERE") # Replace this with your actual API key
+
+# --- Summary cache settings (override via environment) ---
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", os.path.join(".cache", "summaries.sqlite3"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", "2000"))
+SUMMARY_CACHE_MAX_MB = int(os.environ.get("SUMMARY_CACHE_MAX_MB", "64"))
+SUMMARY_CACHE_TTL_HOURS = float(os.environ.get("SUMMARY_CACHE_TTL_HOURS", "168"))
+
+# --- Web pages: ETag/Last-Modified validators (and the extracted text) for conditional re-fetches ---
+HTTP_VALIDATOR_STORE_PATH = os.environ.get("HTTP_VALIDATOR_STORE_PATH", os.path.join(".cache", "http_validators.sqlite3"))
+
+# --- Chunk memo: memoized map/reduce steps, so an edited document only re-runs what changed ---
+CHUNK_MEMO_PATH = os.environ.get("CHUNK_MEMO_PATH", os.path.join(".cache", "chunk_memo.sqlite3"))
+CHUNK_MEMO_TTL_HOURS = float(os.environ.get("CHUNK_MEMO_TTL_HOURS", "336"))
+CHUNK_MEMO_MAX_ENTRIES = int(os.environ.get("CHUNK_MEMO_MAX_ENTRIES", "200000"))
+
+# --- YouTube transcript cache (listings, fetched/translated texts, which fallback worked); empty path disables it ---
+TRANSCRIPT_CACHE_PATH = os.environ.get("TRANSCRIPT_CACHE_PATH", os.path.join(".cache", "transcripts.sqlite3"))
+TRANSCRIPT_CACHE_TTL_HOURS = float(os.environ.get("TRANSCRIPT_CACHE_TTL_HOURS", "168"))
+TRANSCRIPT_NEGATIVE_TTL_MINUTES = float(os.environ.get("TRANSCRIPT_NEGATIVE_TTL_MINUTES", "60"))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSCRIPT_CACHE_MAX_ENTRIES", "5000"))
+# Fallback languages fetched/translated at once when a video has no English transcript
+TRANSCRIPT_RACE_WIDTH = int(os.environ.get("TRANSCRIPT_RACE_WIDTH", "4"))
+
+# --- Groq quotas and map-phase concurrency (per model, shared by all sessions) ---
+GROQ_RPM = int(os.environ.get("GROQ_RPM", "30"))
+GROQ_TPM = int(os.environ.get("GROQ_TPM", "15000"))
+MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", "6"))
+# Most partial summaries a single reduce step combines (map_reduce builds a tree of these)
+REDUCE_FAN_IN = int(os.environ.get("REDUCE_FAN_IN", "8"))
+
+# --- Background summarize jobs: worker threads shared by all sessions, and how long finished jobs stay pollable ---
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_KEEP_SECONDS = int(os.environ.get("JOB_KEEP_SECONDS", "600"))
+
+# --- Hugging Face tokenizers used for token counting (token_budget.py) ---
+# Gemma and Llama 3 default to ungated mirrors of their tokenizers. Gated repos (the official google/gemma-7b-it
+# and meta-llama/Meta-Llama-3-8B-Instruct, and possibly mistralai/Mixtral-8x7B-Instruct-v0.1 depending on its
+# current access terms) need an accepted licence and a token in HF_TOKEN; without one the character estimate is used. Override per model as
+# "model=repo,model=repo"; set TOKENIZER_LOCAL_FILES_ONLY=1 to only use tokenizers already downloaded.
+TOKENIZER_REPOS = dict(pair.split("=", 1) for pair in os.environ.get("TOKENIZER_REPOS", "").split(",") if "=" in pair)
+TOKENIZER_LOCAL_FILES_ONLY = os.environ.get("TOKENIZER_LOCAL_FILES_ONLY", "0") == "1"
+
+# --- Local summaries: instant extractive preview, and the fallback when the Groq call fails ---
+LOCAL_PREVIEW = os.environ.get("LOCAL_PREVIEW", "1") != "0"
+# Optional Hugging Face summarization model (e.g. sshleifer/distilbart-cnn-6-6) that rewrites the fallback extract on CPU
+LOCAL_SUMMARY_MODEL = os.environ.get("LOCAL_SUMMARY_MODEL", "")
+
+# --- Startup / rerun time budget checked by startup_budget.py ---
+COLD_START_BUDGET_MS = float(os.environ.get("COLD_START_BUDGET_MS", "1500"))
+RERUN_BUDGET_MS = float(os.environ.get("RERUN_BUDGET_MS", "150"))
+
+# --- Metrics: serve /metrics and /metrics.json on this port when set (files under .cache/metrics are always written) ---
+# An empty path turns that export off
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH", os.path.join(".cache", "metrics", "spans.jsonl"))
+METRICS_PROM_PATH = os.environ.get("METRICS_PROM_PATH", os.path.join(".cache", "metrics", "summarizer.prom"))
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH", os.path.join(".cache", "metrics", "aggregates.jsonl"))
+# spans.jsonl / aggregates.jsonl are rotated to <name>.1 (one generation kept) once they reach this size
+METRICS_LOG_MAX_MB = float(os.environ.get("METRICS_LOG_MAX_MB", "32"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+
+def is_api_key_present(api_key=GROQ_API_KEY):
+    return bool(api_key) and api_key != "YOUR_GROQ_API_KEY_HERE"
+
+
+def is_api_key_plausible(api_key=GROQ_API_KEY):
+    return is_api_key_present(api_key) and api_key.startswith("gsk_")
@@ -0,0 +1,166 @@
+"""Pre-reduction of loaded text: drops boilerplate and near-duplicate spans before chunking.
+
+Spans are lines/paragraphs for web pages and sentence-ish word windows for transcripts.
+Exact repeats and SimHash near-duplicates (over word 3-shingles) of an earlier span are
+dropped, as are short spans matching known boilerplate (cookie banners, sponsor reads, ...).
+"""
+import hashlib
+import re
+
+import chunking
+
+SIMHASH_BITS = 64
+MAX_HAMMING = 3           # near-duplicate if fingerprints differ in at most this many bits
+BANDS = MAX_HAMMING + 1   # pigeonhole: a match within MAX_HAMMING bits agrees exactly on at least one band
+MIN_SPAN_WORDS = 4        # shorter spans are too small to fingerprint meaningfully (only exact repeats are dropped)
+BOILERPLATE_MAX_WORDS = 25  # longer spans are real paragraphs that merely mention cookies, sponsors, ...
+
+BOILERPLATE_PATTERNS = [
+    r"\b(we|this (web)?site) uses? cookies\b", r"\baccept (all )?cookies\b", r"\bcookie (policy|settings|preferences)\b",
+    r"\bprivacy policy\b.*\bterms\b", r"\ball rights reserved\b", r"^\s*(©|copyright\b)", r"\bsign up for (our|the) newsletter\b",
+    r"\bsubscribe to (our|the|my) (channel|newsletter)\b", r"\b(hit|smash) (the|that) (like|subscribe|bell)\b",
+    r"\b(like and subscribe|don'?t forget to subscribe)\b", r"\bturn on (post )?notifications\b",
+    r"\b(this|today'?s) (video|episode) is sponsored by\b", r"\bthanks to .{1,40} for sponsoring\b",
+    r"\buse (code|coupon) \w+ (for|to get)\b", r"\bskip to (main )?content\b", r"\b(share|follow us) on (facebook|twitter|x|instagram)\b",
+    r"^\s*\[(music|applause|laughter)\]\s*$",
+]
+_BOILERPLATE = re.compile("|".join(BOILERPLATE_PATTERNS), re.I)
+_WORD = re.compile(r"\w+", re.U)
+
+
+def _shingles(words, k=3):
+    if len(words) < k: return [" ".join(words)]
+    return [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+
+
+# Bit-sliced counting: each hash is spread so every bit gets its own 16-bit lane, letting one
+# big-int addition per shingle update all 64 bit counters at once.
+_LANE = 16
+_SPREAD_BYTE = [sum(((b >> j) & 1) << (j * _LANE) for j in range(8)) for b in range(256)]
+
+
+def _spread(h):
+    return sum(_SPREAD_BYTE[(h >> (8 * i)) & 0xFF] << (8 * i * _LANE) for i in range(SIMHASH_BITS // 8))
+
+
+def simhash(words):
+    shingles = _shingles(words)[:(1 << _LANE) - 1]
+    total = 0
+    for shingle in shingles:
+        total += _spread(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"))
+    half, mask = len(shingles) / 2, (1 << _LANE) - 1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if (total >> (bit * _LANE)) & mask > half)
+
+
+class NearDuplicateIndex:
+    """SimHash fingerprints bucketed by band, so lookups only compare against plausible matches."""
+
+    def __init__(self):
+        self.band_bits = SIMHASH_BITS // BANDS
+        self.buckets = [dict() for _ in range(BANDS)]
+
+    def _bands(self, fp):
+        mask = (1 << self.band_bits) - 1
+        return [(fp >> (i * self.band_bits)) & mask for i in range(BANDS)]
+
+    def seen(self, fp):
+        """True if a fingerprint within MAX_HAMMING bits was added before; otherwise add it."""
+        bands = self._bands(fp)
+        for i, band in enumerate(bands):
+            for other in self.buckets[i].get(band, ()):
+                if bin(fp ^ other).count("1") <= MAX_HAMMING: return True
+        for i, band in enumerate(bands): self.buckets[i].setdefault(band, []).append(fp)
+        return False
+
+
+def iter_spans(text, transcript=False):
+    """Lines for pages; content-defined sentence/word-window units for transcripts (which rarely have newlines)."""
+    if transcript:
+        for start, end in chunking.iter_units(text): yield text[start:end]
+    else:
+        yield from text.splitlines(keepends=True)
+
+
+# Same boundaries as str.splitlines
+_LINE_END = re.compile("\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+class _LineStream:
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, text):
+        buf, start = self._buf + text, 0
+        for m in _LINE_END.finditer(buf):
+            if m.end() == len(buf) and m.group() == "\r": break  # may be the first half of \r\n
+            yield buf[start:m.end()]; start = m.end()
+        self._buf = buf[start:]
+
+    def close(self):
+        if self._buf: yield self._buf
+        self._buf = ""
+
+
+def digest(text):
+    """8-byte fingerprint for exact-repeat checks, so seen spans are not kept as a second copy of the text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def is_boilerplate(span, words=None):
+    """True for a short span matching BOILERPLATE_PATTERNS; `words` is its word count if already known."""
+    if words is None: words = len(_WORD.findall(span))
+    return words <= BOILERPLATE_MAX_WORDS and bool(_BOILERPLATE.search(span))
+
+
+def iter_spans_stream(pieces, transcript=False):
+    """iter_spans over text arriving in pieces (transcript segments, page blocks), without joining it first."""
+    stream = chunking.UnitStream() if transcript else _LineStream()
+    for piece in pieces: yield from stream.feed(piece)
+    yield from stream.close()
+
+
+class Deduplicator:
+    """Stateful filter: spans are checked against everything seen earlier in the same document."""
+
+    def __init__(self):
+        self.exact = set()  # digests of normalized spans
+        self.near = NearDuplicateIndex()
+        self.chars_in = self.chars_out = 0
+        self.spans_in = self.spans_removed = 0
+
+    def keep(self, span):
+        self.chars_in += len(span); self.spans_in += 1
+        words = _WORD.findall(span.lower())
+        if words:
+            normalized = " ".join(words)
+            key = digest(normalized)
+            drop = key in self.exact or is_boilerplate(span, len(words))
+            if not drop and len(words) >= MIN_SPAN_WORDS: drop = self.near.seen(simhash(words))
+            self.exact.add(key)
+            if drop:
+                self.spans_removed += 1
+                return False
+        self.chars_out += len(span)
+        return True
+
+    def filter_text(self, text, transcript=False):
+        return "".join(span for span in iter_spans(text, transcript) if self.keep(span))
+
+    def filter_stream(self, pieces, transcript=False):
+        """Kept spans, yielded as soon as they are complete."""
+        return (span for span in iter_spans_stream(pieces, transcript) if self.keep(span))
+
+    @property
+    def chars_removed(self):
+        return self.chars_in - self.chars_out
+
+
+def dedupe_documents(docs, transcript=False):
+    """Return (filtered docs, Deduplicator with the removal stats). Empty documents are dropped."""
+    from langchain.schema import Document
+    dedup = Deduplicator()
+    out = []
+    for doc in docs:
+        text = dedup.filter_text(doc.page_content, transcript)
+        if text.strip(): out.append(Document(page_content=text, metadata=dict(doc.metadata)))
+    return out, dedup
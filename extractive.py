@@ -0,0 +1,142 @@
+"""Local, CPU-only summaries: an instant extractive preview and the fallback when the LLM fails.
+
+Sentences are scored against the document's TF-IDF centroid, and the best candidates are re-ranked
+with TextRank (PageRank over their cosine-similarity graph). The chosen sentences are returned in
+document order. An optional Hugging Face summarization model (LOCAL_SUMMARY_MODEL) can rewrite
+that extract when a fallback is needed; it is loaded once per process.
+"""
+import functools
+import logging
+import math
+import re
+import time
+from collections import Counter
+
+import chunking
+import dedupe
+
+logger = logging.getLogger(__name__)
+
+MAX_SENTENCES = 1500      # sentences kept while streaming (evenly thinned beyond this)
+GRAPH_CANDIDATES = 120    # best centroid matches that go into the TextRank graph
+MIN_SENTENCE_WORDS = 5
+DAMPING = 0.85
+ITERATIONS = 30
+TOLERANCE = 1e-6
+
+_WORD = re.compile(r"[^\W\d_]{2,}", re.U)
+STOPWORDS = set("""a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers him his how i if in
+into is it its itself just like me more most my no nor not now of off on once only or other our out over own really right same she
+should so some such than that the their them then there these they this those through to too under until up us very was we were
+what when where which while who whom why will with would you your yeah okay oh um uh gonna got get going know think thing things""".split())
+
+
+def iter_sentences(pieces, transcript=False):
+    """Sentence-sized spans of text arriving in pieces (word groups for unpunctuated transcripts)."""
+    for span in dedupe.iter_spans_stream(pieces, transcript):
+        for start, end in chunking.iter_units(span):
+            sentence = " ".join(span[start:end].split())
+            if sentence: yield sentence
+
+
+def _collect(sentences):
+    """Keep at most MAX_SENTENCES evenly spaced usable sentences, without holding the whole text."""
+    kept, stride, seen, exact = [], 1, 0, set()
+    for sentence in sentences:
+        words = sentence.split()
+        if len(words) < MIN_SENTENCE_WORDS or dedupe.is_boilerplate(sentence): continue
+        key = dedupe.digest(sentence.lower())
+        if key in exact: continue
+        exact.add(key)
+        if seen % stride == 0:
+            kept.append(sentence)
+            if len(kept) > MAX_SENTENCES: kept, stride = kept[::2], stride * 2
+        seen += 1
+    return kept
+
+
+def _vectors(sentences):
+    tokens = [[w for w in _WORD.findall(s.lower()) if w not in STOPWORDS] for s in sentences]
+    df = Counter(w for t in tokens for w in set(t))
+    idf = {w: math.log((1 + len(sentences)) / (1 + c)) + 1 for w, c in df.items()}
+    vectors = []
+    for t in tokens:
+        v = {w: c * idf[w] for w, c in Counter(t).items()}
+        norm = math.sqrt(sum(x * x for x in v.values())) or 1.0
+        vectors.append({w: x / norm for w, x in v.items()})
+    return vectors
+
+
+def _dot(a, b):
+    if len(a) > len(b): a, b = b, a
+    return sum(x * b.get(w, 0.0) for w, x in a.items())
+
+
+def _textrank(vectors):
+    n = len(vectors)
+    sims = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n): sims[i][j] = sims[j][i] = _dot(vectors[i], vectors[j])
+    out = [sum(row) or 1.0 for row in sims]
+    incoming = [[(j, sims[j][i] / out[j]) for j in range(n) if sims[j][i]] for i in range(n)]
+    rank = [1.0 / n] * n
+    for _ in range(ITERATIONS):
+        previous, rank = rank, [(1 - DAMPING) / n + DAMPING * sum(rank[j] * w for j, w in edges) for edges in incoming]
+        if sum(abs(a - b) for a, b in zip(rank, previous)) < TOLERANCE: break
+    return rank
+
+
+def rank_sentences(sentences):
+    """Sentence indexes, best first."""
+    if not sentences: return []
+    vectors = _vectors(sentences)
+    centroid = Counter()
+    for v in vectors: centroid.update(v)
+    norm = math.sqrt(sum(x * x for x in centroid.values())) or 1.0
+    centrality = [_dot(v, centroid) / norm for v in vectors]
+    candidates = sorted(range(len(sentences)), key=centrality.__getitem__, reverse=True)[:GRAPH_CANDIDATES]
+    rank = _textrank([vectors[i] for i in candidates])
+    top_rank, top_centrality = max(rank) or 1.0, centrality[candidates[0]] or 1.0
+    score = {i: 0.5 * r / top_rank + 0.5 * centrality[i] / top_centrality for i, r in zip(candidates, rank)}
+    return sorted(candidates, key=score.__getitem__, reverse=True)
+
+
+def summarize_pieces(pieces, transcript=False, max_words=150, max_sentences=8):
+    """Extractive summary as a markdown bullet list (empty string if nothing usable)."""
+    sentences = _collect(iter_sentences(pieces, transcript))
+    chosen, words = [], 0
+    for i in rank_sentences(sentences):
+        if len(chosen) >= max_sentences or (chosen and words >= max_words): break
+        chosen.append(i); words += len(sentences[i].split())
+    return "\n".join(f"- {sentences[i]}" for i in sorted(chosen))
+
+
+def preview(pieces, transcript=False, max_tokens=600):
+    """Dict with the extractive preview text, how long it took and the method, sized to the requested length."""
+    started = time.time()
+    text = summarize_pieces(pieces, transcript, max_words=max(60, max_tokens // 4), max_sentences=max(4, max_tokens // 75))
+    return {"text": text, "seconds": time.time() - started, "method": "extractive"}
+
+
+@functools.lru_cache(maxsize=None)
+def get_local_model(model_name):
+    """Hugging Face summarization pipeline on CPU, or None if it cannot be loaded."""
+    try:
+        from transformers import pipeline as hf_pipeline
+        return hf_pipeline("summarization", model=model_name, device=-1)
+    except Exception as e:
+        logger.warning("Local summarization model %s unavailable (%s); using extractive summaries only", model_name, e)
+        return None
+
+
+def rewrite(extract, model_name, max_tokens=600):
+    """Abstractive rewrite of an extract with the local model; None when no model is configured/available."""
+    model = get_local_model(model_name) if model_name and extract else None
+    if model is None: return None
+    try:
+        source = " ".join(line[2:] if line.startswith("- ") else line for line in extract.splitlines())
+        return model(source, max_length=min(max_tokens, 256), min_length=min(60, max_tokens // 4), truncation=True)[0]["summary_text"]
+    except Exception as e:
+        logger.warning("Local summarization failed (%s); keeping the extract", e)
+        return None
@@ -0,0 +1,143 @@
+"""Process-wide background jobs with single-flight deduplication.
+
+A job runs on a shared worker pool instead of the requesting Streamlit script thread. Submitting a
+key that is already queued or running attaches to that job rather than starting a second,
+identical one. Requesters poll the job's events and partial output, and may cancel; the job only
+stops once every attached requester has cancelled.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's thread at its next checkpoint once the job has been cancelled."""
+
+
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.status = "queued"
+        self.created = time.time()
+        self.started = self.finished = None
+        self.events = []      # {"type": "progress"|"message"|"warning", ...}, replayed to late attachers
+        self.state = {}       # latest values the job publishes for display (e.g. the chunk stream)
+        self.partial = ""     # streamed output so far
+        self.result = self.error = None
+        self.watchers = 1
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ACTIVE
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def emit(self, type, **payload):
+        with self._lock: self.events.append({"type": type, "at": time.time(), **payload})
+
+    def progress(self, kind, text, pct):
+        self.emit("progress", kind=kind, text=text, pct=pct)
+
+    def message(self, kind, text):
+        self.emit("message", kind=kind, text=text)
+
+    def append_output(self, token):
+        self.check()
+        self.partial += token
+
+    def events_since(self, index):
+        with self._lock: return self.events[index:]
+
+    def check(self):
+        """Cancellation checkpoint for the job's own thread."""
+        if self._cancel.is_set(): raise JobCancelled(self.id)
+
+    def iter_checked(self, items):
+        for item in items:
+            self.check()
+            yield item
+
+    def attach(self):
+        with self._lock: self.watchers += 1
+
+    def cancel(self):
+        """Detach one requester; the job is cancelled when none are left. Returns True if it was."""
+        with self._lock:
+            self.watchers -= 1
+            if self.watchers > 0 or not self.active: return False
+            self._cancel.set()
+            return True
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        self.status, self.result, self.error, self.finished = status, result, error, time.time()
+        self._done.set()
+
+
+class JobManager:
+    def __init__(self, workers=4, keep_seconds=600):
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="summarize-job")
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._jobs = {}
+        self.submitted = self.deduplicated = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Run `fn(job, *args, **kwargs)` on the pool, or return the queued/running job with the same key."""
+        with self._lock:
+            self._prune()
+            job = self._inflight.get(key)
+            if job is not None and job.active and not job.cancel_requested:
+                job.attach(); self.deduplicated += 1
+                tracing.record_cache("inflight_jobs", True)
+                return job
+            job = Job(key)
+            self._inflight[key] = self._jobs[job.id] = job
+            self.submitted += 1
+        tracing.record_cache("inflight_jobs", False)
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            if job.cancel_requested: job._finish("cancelled"); return
+            job.status, job.started = "running", time.time()
+            try: job._finish("done", result=fn(job, *args, **kwargs))
+            except Exception as e:
+                # Cancellation can surface wrapped (e.g. as an interrupted stream), so trust the flag
+                if job.cancel_requested: job._finish("cancelled")
+                else: job._finish("error", error=str(e) or type(e).__name__)
+        finally:
+            with self._lock:
+                if self._inflight.get(job.key) is job: del self._inflight[job.key]
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [i for i, j in self._jobs.items() if j.finished and j.finished < cutoff]: del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock: return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        with self._lock:
+            queued = sorted((j for j in self._jobs.values() if j.status == "queued"), key=lambda j: j.created)
+        return next((i + 1 for i, j in enumerate(queued) if j is job), 0)
+
+    def stats(self):
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {"running": statuses.count("running"), "queued": statuses.count("queued"), "submitted": self.submitted, "deduplicated": self.deduplicated}
@@ -0,0 +1,130 @@
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` tokens (possibly going negative) and return how long the caller must wait."""
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute quotas, shared by every caller of one model."""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+
+    def acquire(self, est_tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(est_tokens))
+        if wait > 0: time.sleep(wait)
+        return wait
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name, rpm, tpm):
+    """Process-wide limiter per model, so concurrent sessions share one quota."""
+    with _limiters_lock:
+        key = (model_name, rpm, tpm)
+        if key not in _limiters: _limiters[key] = RateLimiter(rpm, tpm)
+        return _limiters[key]
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(e):
+    if getattr(e, "retryable", True) is False: return False
+    if getattr(e, "status_code", None) == 429: return True
+    response = getattr(e, "response", None)
+    if getattr(response, "status_code", None) == 429: return True
+    msg = str(e).lower()
+    return "429" in msg or "rate limit" in msg or "rate_limit" in msg
+
+
+def _retry_after(e):
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try: return float(headers.get("retry-after"))
+    except (TypeError, ValueError): return None
+
+
+def call_with_backoff(fn, limiter=None, est_tokens=0, max_retries=6, base_delay=1.0, max_delay=30.0):
+    """Run `fn()` under the rate limiter, retrying 429s with exponential backoff and full jitter."""
+    for attempt in range(max_retries + 1):
+        if limiter:
+            waited = limiter.acquire(est_tokens)
+            if waited: tracing.increment("queue_wait", waited)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries: raise
+            delay = _retry_after(e)
+            if delay is None: delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            tracing.increment("retries"); tracing.increment("queue_wait", delay)
+            time.sleep(delay)
+
+
+def run_prompts(llm, texts, limiter=None, concurrency=4, max_tokens=0, on_result=None, count_tokens=estimate_tokens, stage="map", max_pending=None):
+    """Send every prompt concurrently and return the completions in input order.
+
+    `texts` may be a lazy iterable (e.g. chunks produced while the source is still loading); it is
+    only advanced while fewer than `max_pending` prompts are in flight, so prompts are not buffered
+    ahead of the workers. `on_result(done, total)` reports the total seen so far.
+    """
+    results, pending, done = [], {}, 0
+    max_pending = max_pending or 2 * max(1, concurrency)
+
+    def complete(index, text, submitted):
+        with tracing.span(f"llm.{stage}", item=index, queue_wait=time.time() - submitted):
+            prompt_tokens = count_tokens(text)
+            message = call_with_backoff(lambda: llm.invoke(text), limiter, prompt_tokens + max_tokens)
+            tracing.record_usage(message, prompt_tokens, estimate_tokens(message.content))
+            return message.content
+
+    def collect(block):
+        nonlocal done
+        finished = wait(pending, return_when=FIRST_COMPLETED)[0] if block else [f for f in pending if f.done()]
+        for future in finished:
+            results[pending.pop(future)] = future.result(); done += 1
+            if on_result: on_result(done, len(results))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        try:
+            for index, text in enumerate(texts):
+                while len(pending) >= max_pending: collect(True)
+                results.append(None)
+                # Each task runs in a copy of the caller's context so its span joins the caller's trace
+                pending[pool.submit(contextvars.copy_context().run, complete, index, text, time.time())] = index
+                collect(False)
+            while pending: collect(True)
+        except BaseException:
+            for future in pending: future.cancel()
+            raise
+    return results
+
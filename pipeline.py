@@ -0,0 +1,293 @@
+"""Streamlit-free building blocks shared by app.py and the batch CLI."""
+import hashlib
+import logging
+import time
+
+import chunk_memo
+import chunking
+import config
+import summary_cache
+import token_budget
+import tracing
+from sources import extract_youtube_id, fetch_transcript_segments, get_youtube_transcript, is_youtube_url, iter_page_text, iter_transcript_text, load_website, log_message
+
+logger = logging.getLogger(__name__)
+
+
+class SourceError(Exception):
+    """The URL could not be turned into any text to summarize."""
+
+
+def build_templates(max_tokens):
+    """(map, combine, refine) templates; the refine one folds the next chunk into `{existing_answer}`."""
+    if max_tokens <= 400: return ("Briefly summarize key points:\n\n{text}\n\nCONCISE SUMMARY:", "Combine summaries into 2-3 sentences:\n\n{text}\n\nFINAL CONCISE SUMMARY:",
+                                  "Existing summary:\n\n{existing_answer}\n\nUpdate it with any key points from this text, keeping 2-3 sentences:\n\n{text}\n\nREFINED CONCISE SUMMARY:")
+    elif max_tokens <= 800: return ("Summarize main ideas & details:\n\n{text}\n\nBALANCED SUMMARY:", "Create comprehensive summary:\n\n{text}\n\nFINAL BALANCED SUMMARY:",
+                                    "Existing summary:\n\n{existing_answer}\n\nRefine it with the main ideas & details of this text:\n\n{text}\n\nREFINED BALANCED SUMMARY:")
+    else: return ("Detailed summary with examples/arguments:\n\n{text}\n\nDETAILED SUMMARY:", "Synthesize into in-depth summary:\n\n{text}\n\nFINAL DETAILED SUMMARY:",
+                  "Existing summary:\n\n{existing_answer}\n\nExtend it with the examples/arguments of this text:\n\n{text}\n\nREFINED DETAILED SUMMARY:")
+
+
+def build_prompts(map_template, combine_template, refine_template):
+    from langchain.prompts import PromptTemplate
+    return (PromptTemplate(template=map_template, input_variables=["text"]), PromptTemplate(template=combine_template, input_variables=["text"]),
+            PromptTemplate(template=refine_template, input_variables=["existing_answer", "text"]))
+
+
+def make_llm(model_name, max_tokens, api_key=config.GROQ_API_KEY):
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=model_name, groq_api_key=api_key, max_tokens=max_tokens)
+
+
+def open_summary_cache():
+    return summary_cache.SummaryCache(config.SUMMARY_CACHE_PATH, max_entries=config.SUMMARY_CACHE_MAX_ENTRIES, max_bytes=config.SUMMARY_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=config.SUMMARY_CACHE_TTL_HOURS * 3600)
+
+
+def open_chunk_memo():
+    return chunk_memo.ChunkMemoStore()
+
+
+def memo_scope(store, model_name, max_tokens, source):
+    """Per-run memo view; the tree id ties successive versions of one source together."""
+    return chunk_memo.MemoScope(store, f"{model_name}|{max_tokens}", tree_id=f"{source}|{model_name}|{max_tokens}")
+
+
+def cache_identity(url, model_name, chain_type, max_tokens, *templates):
+    """Return (source, key) for the summary cache; `templates` are the ones from build_templates."""
+    source = summary_cache.source_key(url, extract_youtube_id(url) if is_youtube_url(url) else None)
+    return source, summary_cache.make_key(source, model_name, chain_type, max_tokens, summary_cache.prompt_hash(*templates))
+
+
+def lookup_summary(cache, key):
+    """Cached entry for `key`, or None; a cache that cannot be read (e.g. locked by another process) counts as a miss."""
+    with tracing.span("cache.lookup"):
+        try: cached = cache.get(key)
+        except Exception as e:
+            logger.warning("Summary cache lookup failed: %s", e); cached = None
+        tracing.annotate(hit=cached is not None)
+    tracing.record_cache("summary", cached is not None)
+    return cached
+
+
+def source_digest(docs):
+    """Fingerprint of a loaded web page's text, stored with its summary to tell when the page has changed."""
+    h = hashlib.sha256()
+    for doc in docs: h.update(doc.page_content.encode("utf-8")); h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+def is_current(cached, url, docs=None):
+    """Whether a cached summary still matches its source.
+
+    Web pages are re-fetched (a conditional GET when the site sends validators) unless their `docs`
+    are passed in; if that fails, the cached summary is kept. A video's transcript does not change.
+    """
+    if is_youtube_url(url): return True
+    digest = cached["meta"].get("digest")
+    if not digest: return False
+    if docs is None:
+        try:
+            with tracing.span("cache.revalidate"): docs = load_website(url)
+        except Exception as e:
+            logger.warning("Could not re-check %s (%s); using the cached summary", url, e); return True
+    return source_digest(docs) == digest if docs else True
+
+
+def store_summary(cache, key, source, summary, meta):
+    """Cache a finished summary; a failed write is logged and the summary is simply left uncached."""
+    try: cache.set(key, source, summary, meta)
+    except Exception as e: logger.warning("Could not cache the summary of %s: %s", source, e)
+
+
+def load_documents(url, notify=log_message):
+    from langchain.schema import Document
+    if is_youtube_url(url):
+        video_id = extract_youtube_id(url)
+        if not video_id: raise SourceError("No YouTube ID")
+        transcript = get_youtube_transcript(video_id, notify)
+        if not transcript: raise SourceError("No usable transcript")
+        return [Document(page_content=transcript, metadata={"source": url})]
+    docs = load_website(url)
+    if not docs or not docs[0].page_content: raise SourceError("No content found/parsed")
+    return docs
+
+
+def load_text_source(url, notify=log_message):
+    """Return (open_pieces, metadata); `open_pieces()` gives the source's text as a fresh iterator of pieces.
+
+    Nothing is joined into one string, so ChunkStream can chunk it as it goes; the fetched
+    segments/blocks are kept so the local preview can read them a second time.
+    """
+    if is_youtube_url(url):
+        video_id = extract_youtube_id(url)
+        if not video_id: raise SourceError("No YouTube ID")
+        segments = fetch_transcript_segments(video_id, notify)
+        if not segments: raise SourceError("No usable transcript")
+        return (lambda: iter_transcript_text(segments)), {"source": url, "segments": len(segments)}
+    docs = load_website(url)
+    if not docs or not docs[0].page_content: raise SourceError("No content found/parsed")
+    return (lambda: iter_page_text(docs)), {**docs[0].metadata, "elements": len(docs), "chars": sum(len(d.page_content) for d in docs), "digest": source_digest(docs)}
+
+
+def start_preview(job, open_pieces, transcript, max_tokens):
+    """Build the extractive preview on a side thread, so the first map calls are not held up by it.
+
+    Published as `job.state["preview"]`; returns the thread (join it before using the preview as a fallback).
+    """
+    import contextvars
+    import threading
+    import extractive
+
+    def build():
+        with tracing.span("preview", transcript=transcript):
+            preview = extractive.preview(open_pieces(), transcript, max_tokens)
+            tracing.annotate(chars=len(preview["text"]))
+        if preview["text"]: job.state["preview"] = preview
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(build,), name=f"preview-{job.id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def local_fallback(job, preview_thread, max_tokens, timeout=10):
+    """Summary to show when the LLM failed: the local model's rewrite of the preview, else the preview itself (None if there is none)."""
+    import extractive
+    if preview_thread is None: return None
+    preview_thread.join(timeout)
+    preview = job.state.get("preview")
+    if not preview: return None
+    with tracing.span("fallback", model=config.LOCAL_SUMMARY_MODEL or "extractive"):
+        rewritten = extractive.rewrite(preview["text"], config.LOCAL_SUMMARY_MODEL, max_tokens)
+    return {"summary": rewritten or preview["text"], "method": "local model" if rewritten else "extractive"}
+
+
+class ChunkStream:
+    """Chunk Documents produced while the source text is consumed: dedupe -> content-defined packing.
+
+    For a single document it yields the same chunks as prereduce_documents + split_documents, but
+    only holds the chunk being filled and keeps running totals (`stats()`) instead of re-scanning.
+    Iterate it once, e.g. straight into summarizer.summarize_documents.
+    """
+
+    PREVIEW_CHARS = 500
+
+    def __init__(self, pieces, model_name, chain_type, max_tokens, map_template, refine_template, transcript=False, metadata=None):
+        import dedupe
+        self.pieces = pieces
+        self.metadata = metadata or {}
+        self.transcript = transcript
+        self.chars_per_token = token_budget.model_info(model_name)["chars_per_token"]
+        self.count_tokens = token_budget.token_counter(model_name)
+        self.chunk_tokens = token_budget.chunk_token_budget(model_name, chain_type, max_tokens, map_template, refine_template)
+        self.dedup = dedupe.Deduplicator()
+        self.chunker = chunking.ChunkAccumulator(self.chunk_tokens, self.count_tokens)
+        self.preview = ""
+        self.finished = False
+
+    def _kept(self):
+        for span in self.dedup.filter_stream(self.pieces, self.transcript):
+            if len(self.preview) < self.PREVIEW_CHARS: self.preview += span[:self.PREVIEW_CHARS - len(self.preview)]
+            yield span
+
+    def __iter__(self):
+        from langchain.schema import Document
+        busy, resumed = 0.0, time.time()
+        for span in self._kept():
+            for chunk in self.chunker.feed(span):
+                busy += time.time() - resumed
+                yield Document(page_content=chunk, metadata=dict(self.metadata))
+                resumed = time.time()
+        for chunk in self.chunker.close():
+            busy += time.time() - resumed
+            yield Document(page_content=chunk, metadata=dict(self.metadata))
+            resumed = time.time()
+        busy += time.time() - resumed
+        self.finished = True
+        # Ingestion is interleaved with the map step, so only the time spent in here is recorded
+        tracing.record_span("ingest", busy, transcript=self.transcript, **self.stats())
+
+    def stats(self):
+        removed = self.dedup.chars_removed
+        return {"chunks": self.chunker.chunks, "characters": self.chunker.chars, "words": self.chunker.words, "est_tokens": self.chunker.tokens,
+                "chars_removed": removed, "est_tokens_removed": int(removed / self.chars_per_token), "spans_removed": self.dedup.spans_removed, "spans": self.dedup.spans_in}
+
+
+def summarize_job(job, url, model_name, chain_type, max_tokens, llm, cache=None, memo_store=None, limiter=None,
+                  concurrency=config.MAP_CONCURRENCY, fan_in=config.REDUCE_FAN_IN):
+    """Body of a summarize job (see jobs.JobManager): load, stream chunks, summarize and cache.
+
+    Progress, status messages, the local preview and the streamed summary are published on `job` for
+    requesters to poll; the result dict carries the summary plus what the UI shows once it is done.
+    If the LLM fails, the local summary is returned instead (marked `fallback`, never cached).
+    """
+    import summarizer
+    map_template, combine_template, refine_template = templates = build_templates(max_tokens)
+    map_prompt, combine_prompt, refine_prompt = build_prompts(*templates)
+    source, key = cache_identity(url, model_name, chain_type, max_tokens, *templates)
+    trace = job.state["trace"] = tracing.Trace("request", url=url, model=model_name, chain_type=chain_type, max_tokens=max_tokens, job=job.id)
+    try:
+        with tracing.activate(trace):
+            transcript = is_youtube_url(url)
+            job.progress("info", "🎬 Processing YouTube..." if transcript else "🌐 Loading Website...", 30)
+            open_pieces, metadata = load_text_source(url, job.message)
+            job.check()
+            preview_thread = start_preview(job, open_pieces, transcript, max_tokens) if config.LOCAL_PREVIEW else None
+            loaded = f"{metadata['segments']:,} segments" if transcript else f"{metadata['elements']} element(s), {metadata['chars']:,} chars"
+            job.progress("success", f"✅ {'Transcript' if transcript else 'Website Loaded'}: {loaded}", 45)
+
+            stream = job.state["stream"] = ChunkStream(open_pieces(), model_name, chain_type, max_tokens, map_template, refine_template, transcript=transcript, metadata={"source": url})
+            job.progress("info", f"🧠 Generating summary ('{chain_type}')...", 60)
+            docs = job.iter_checked(stream)
+            if chain_type == "stuff":  # one prompt over everything: the whole text is needed up front
+                docs = list(docs)
+                est_tokens, context_window = stream.stats()["est_tokens"], token_budget.model_info(model_name)["context_window"]
+                if est_tokens + max_tokens + token_budget.prompt_overhead(model_name, map_template) > context_window:
+                    job.emit("warning", text=f"Content (~{est_tokens:.0f} tokens) may be too long for 'stuff' with {model_name} (~{context_window}). Try map_reduce/refine.")
+
+            def on_progress(stage, done, total):
+                job.check()
+                stage, _, level = stage.partition(":")
+                label = {"map": "Summarized chunk", "reduce": f"Reduced batch (level {level})", "refine": "Refined chunk"}[stage]
+                more = "+" if stage != "reduce" and not stream.finished else ""
+                job.progress("info", f"🧠 {label} {done}/{total}{more}...", 60 + int((35 if stream.finished or stage == "reduce" else 20) * done / total))
+
+            memo = memo_scope(memo_store, model_name, max_tokens, source) if memo_store else None
+            started = time.time()
+            try:
+                summary = summarizer.summarize_documents(llm, chain_type, docs, map_prompt, combine_prompt, refine_prompt, limiter=limiter, concurrency=concurrency, max_tokens=max_tokens,
+                                                         count_tokens=stream.count_tokens, on_progress=on_progress, on_token=job.append_output, memo=memo,
+                                                         reduce_tokens=token_budget.reduce_token_budget(model_name, max_tokens, combine_template), fan_in=fan_in)
+            except Exception as e:
+                fallback = None if job.cancel_requested else local_fallback(job, preview_thread, max_tokens)
+                if not fallback: raise
+                job.emit("warning", text=f"AI summary failed ({str(e) or type(e).__name__}); showing a local {fallback['method']} summary instead.")
+                return {"summary": fallback["summary"], "seconds": time.time() - started, "chunks": stream.stats()["chunks"], "memo_hits": memo.hits if memo else 0,
+                        "memo_misses": memo.misses if memo else 0, "fallback": fallback["method"]}
+            seconds = time.time() - started
+        chunks = stream.stats()["chunks"]
+        if cache: store_summary(cache, key, source, summary, {"model": model_name, "chain_type": chain_type, "max_tokens": max_tokens, "chunks": chunks, "seconds": round(seconds, 3), "digest": metadata.get("digest")})
+        return {"summary": summary, "seconds": seconds, "chunks": chunks, "memo_hits": memo.hits if memo else 0, "memo_misses": memo.misses if memo else 0}
+    finally:
+        trace.finish()
+
+
+def prereduce_documents(docs, model_name, transcript=False):
+    """Drop boilerplate and near-duplicate spans; returns (docs, stats) with stats on what was removed."""
+    import dedupe
+    with tracing.span("dedupe", transcript=transcript):
+        reduced, dedup = dedupe.dedupe_documents(docs, transcript)
+        chars_per_token = token_budget.model_info(model_name)["chars_per_token"]
+        stats = {"chars_removed": dedup.chars_removed, "est_tokens_removed": int(dedup.chars_removed / chars_per_token), "spans_removed": dedup.spans_removed, "spans": dedup.spans_in}
+        tracing.annotate(**stats)
+    return (reduced or docs), stats
+
+
+def split_documents(docs, model_name, chain_type, max_tokens, map_template, refine_template):
+    """Token-packed chunks for the model; returns (split_docs, chunk_tokens, est_tokens, count_tokens)."""
+    with tracing.span("split", model=model_name):
+        count_tokens = token_budget.token_counter(model_name)
+        chunk_tokens = token_budget.chunk_token_budget(model_name, chain_type, max_tokens, map_template, refine_template)
+        split_docs = token_budget.make_text_splitter(model_name, chunk_tokens).split_documents(docs)
+        est_tokens = sum(count_tokens(doc.page_content) for doc in split_docs)
+        tracing.annotate(chunks=len(split_docs), est_tokens=est_tokens)
+    return split_docs, chunk_tokens, est_tokens, count_tokens
@@ -0,0 +1,224 @@
+import contextvars
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Status messages are reported as (kind, text) where kind is "success", "info" or "error";
+# the Streamlit app renders them as styled boxes, headless callers log them.
+_LOG_LEVELS = {"success": logging.INFO, "info": logging.INFO, "error": logging.WARNING}
+
+
+def log_message(kind, text):
+    logger.log(_LOG_LEVELS.get(kind, logging.INFO), text)
+
+
+def is_youtube_url(url):
+    return "youtube" in url or "youtu.be" in url
+
+
+def extract_youtube_id(url):
+    patterns = [
+        r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([\w-]+)',
+        r'(?:youtube\.com\/embed\/)([\w-]+)',
+        r'(?:youtube\.com\/v\/)([\w-]+)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+def get_youtube_transcript(video_id, notify=log_message):
+    segments = fetch_transcript_segments(video_id, notify)
+    return " ".join(t['text'] for t in segments) if segments is not None else None
+
+
+def iter_transcript_text(segments):
+    """Transcript text piece by piece; joined, the pieces equal get_youtube_transcript's result."""
+    for i, t in enumerate(segments): yield f" {t['text']}" if i else t['text']
+
+
+def _raw_segments(fetched):
+    """Plain {"text", "start", "duration"} dicts, whichever youtube-transcript-api version produced them."""
+    if hasattr(fetched, "to_raw_data"): return fetched.to_raw_data()
+    return [dict(s) for s in fetched]
+
+
+def _describe(lang, names=None):
+    source, _, target = lang.partition(">")
+    name = (names or {}).get(source, source)
+    return f"{name} → English" if target else name
+
+
+def _candidate_lang(code, translatable):
+    """Cache key for a transcript: its code if English, "<code>>en" for a translation to English, None if unusable."""
+    if code == "en" or code.startswith("en-"): return code
+    return f"{code}>en" if translatable else None
+
+
+def _preference(remembered):
+    return lambda lang: (lang != remembered, lang != "en", ">" in lang, lang != "hi>en")
+
+
+def transcript_candidates(transcript_list, remembered=None):
+    """(lang, transcript) pairs in preference order: the one that worked last time, English, Hindi→English, the rest→English.
+
+    `lang` is the cache key: the language code, or "<code>>en" for a translation to English.
+    """
+    candidates, seen = [], set()
+    for t in transcript_list:  # manually created transcripts come before generated ones
+        lang = _candidate_lang(t.language_code, t.is_translatable)
+        if lang and lang not in seen: seen.add(lang); candidates.append((lang, t))
+    order = _preference(remembered)
+    return sorted(candidates, key=lambda c: order(c[0]))
+
+
+def cached_candidate(cache, video_id, langs):
+    """(lang, segments) for the first of `langs` with a cached transcript, or (None, None)."""
+    for lang in langs:
+        segments = cache.get_text(video_id, lang)
+        if segments: return lang, segments
+    return None, None
+
+
+def _fetch_candidate(video_id, lang, transcript, cache=None):
+    translated = ">" in lang
+    with tracing.span("transcript.translate" if translated else "transcript.fetch", video_id=video_id, lang=lang.partition(">")[0]):
+        segments = _raw_segments((transcript.translate("en") if translated else transcript).fetch())
+    if not any(s["text"].strip() for s in segments): raise ValueError("transcript is empty")
+    if cache is not None: cache.set_text(video_id, lang, segments)
+    return segments
+
+
+def race_candidates(video_id, candidates, cache=None, width=4):
+    """Fetch/translate the candidates concurrently; returns (lang, segments, errors) for the first usable one.
+
+    (None, None, errors) when all fail. Candidates already running when the winner arrives finish in
+    the background and are cached (fetch_transcript_segments checks every candidate's cached text
+    before going to YouTube); queued ones are cancelled.
+    """
+    errors = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, min(width, len(candidates))), thread_name_prefix="transcript")
+    futures = {pool.submit(contextvars.copy_context().run, _fetch_candidate, video_id, lang, t, cache): lang for lang, t in candidates}
+    try:
+        for future in as_completed(futures):
+            try: return futures[future], future.result(), errors
+            except Exception as e: errors[futures[future]] = e
+        return None, None, errors
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_transcript_segments(video_id, notify=log_message, cache=None):
+    """The best transcript's segments (English, else translated to English), or None.
+
+    Answered from the transcript cache when the video was resolved recently: the transcript that
+    worked last time, else any cached candidate from the cached listing. Otherwise one listing
+    call, then the preferred transcript (the one that worked last time, or English); if there is
+    none or it fails, the fallback translations are raced and the first usable one wins.
+    """
+    from youtube_transcript_api import YouTubeTranscriptApi
+    # Corrected import for youtube-transcript-api exceptions (v1.0.3 uses NoTranscriptFound)
+    from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+    import transcript_cache
+    if cache is None: cache = transcript_cache.default_cache()
+    remembered = cache.get_strategy(video_id) if cache else None
+    listing = cache.get_listing(video_id) if cache else None
+    if cache and listing == []:
+        tracing.record_cache("transcript", True)
+        notify("error", "❌ This video has no transcripts (checked recently).")
+        return None
+    if cache:
+        langs = {_candidate_lang(t["code"], t["translatable"]) for t in listing or []} - {None}
+        lang, segments = cached_candidate(cache, video_id, sorted(langs | {remembered} - {None}, key=_preference(remembered)))
+        if lang:
+            tracing.record_cache("transcript", True)
+            if lang != remembered: cache.set_strategy(video_id, lang)
+            notify("success", f"✅ Transcript loaded from cache ({_describe(lang, {t['code']: t['name'] for t in listing or []})})")
+            return segments
+    tracing.record_cache("transcript", False)
+    try:
+        with tracing.span("transcript.list", video_id=video_id):
+            api = YouTubeTranscriptApi()
+            transcript_list = list(api.list(video_id) if hasattr(api, "list") else YouTubeTranscriptApi.list_transcripts(video_id))
+        if cache: cache.set_listing(video_id, [{"code": t.language_code, "name": t.language, "generated": t.is_generated, "translatable": t.is_translatable} for t in transcript_list])
+        names = {t.language_code: t.language for t in transcript_list}
+        candidates = transcript_candidates(transcript_list, remembered)
+        lang, segments = cached_candidate(cache, video_id, [c[0] for c in candidates]) if cache else (None, None)
+        if lang is None and candidates and (candidates[0][0] == remembered or ">" not in candidates[0][0]):
+            try:
+                lang, segments = candidates[0][0], _fetch_candidate(video_id, *candidates[0], cache)
+            except Exception as e:
+                notify("info", f"ℹ️ {_describe(candidates[0][0], names)} transcript failed ({e}). Trying other languages...")
+                lang, candidates = None, candidates[1:]
+        if lang is None and candidates:
+            notify("info", f"⏳ No English transcript. Translating {', '.join(_describe(c[0], names) for c in candidates)} (first usable wins)...")
+            lang, segments, errors = race_candidates(video_id, candidates, cache, config.TRANSCRIPT_RACE_WIDTH)
+            for failed, e in errors.items(): notify("error", f"⚠️ Error processing {_describe(failed, names)} transcript: {e}")
+        if lang is None:
+            notify("info", f"ℹ️ Available languages: {', '.join(names.values()) or 'none'}")
+            notify("error", "❌ No usable transcripts found after trying all available languages.")
+            return None
+        if cache: cache.set_strategy(video_id, lang)
+        notify("success", f"✅ Found {_describe(lang, names)} transcript!")
+        return segments
+    except (TranscriptsDisabled, NoTranscriptFound) as e:
+        if cache: cache.set_listing(video_id, [])
+        if isinstance(e, TranscriptsDisabled): notify("error", "❌ Transcripts are disabled for this video.")
+        else: notify("error", "❌ No transcript was found for this video, even after checking available languages.")
+        return None
+    except Exception as e:
+        if 'Could not retrieve a transcript for the video' in str(e) and 'YouTube is blocking requests from your IP' in str(e):
+             notify("error", f"❌ Failed to get YouTube transcript. YouTube is likely blocking requests from the server's IP address (common for cloud hosting). Website summarization should still work.")
+             notify("info", f"ℹ️ Error Detail: {e}")
+        else:
+            notify("error", f"❌ An unexpected error occurred while fetching transcripts: {str(e)}")
+            if "For this video" in str(e):
+                 error_msg = str(e)
+                 available_langs = re.findall(r'\* ([a-z\-]+) \("([^"]+)"\)', error_msg)
+                 if available_langs:
+                     lang_codes = [code for code, name in available_langs]
+                     notify("info", f"ℹ️ Detected available language codes in error: {', '.join(lang_codes)}")
+        return None
+
+
+# Below this many characters the fast path probably missed the content (JS-rendered page, PDF, ...)
+MIN_FAST_PATH_CHARS = 500
+
+
+def load_website(url):
+    """Documents for a web page: fast lxml extraction first, UnstructuredURLLoader when that yields too little."""
+    from langchain.schema import Document
+    import web_extract
+    try:
+        with tracing.span("web.fetch", url=url):
+            page = web_extract.fetch_main_text(url)
+            if page: tracing.annotate(http=page["status"], chars=len(page["text"]))
+    except Exception as e:
+        logger.info("Fast extraction failed for %s (%s); falling back to unstructured", url, e)
+        page = None
+    if page and len(page["text"]) >= MIN_FAST_PATH_CHARS:
+        return [Document(page_content=page["text"], metadata={"source": url, "title": page["title"], "extractor": "fast", "http_status": page["status"]})]
+
+    from langchain_community.document_loaders import UnstructuredURLLoader
+    loader = UnstructuredURLLoader(urls=[url], ssl_verify=False, headers={"User-Agent": "Mozilla/5.0"})
+    with tracing.span("web.unstructured", url=url): docs = loader.load()
+    for doc in docs: doc.metadata["extractor"] = "unstructured"
+    return docs
+
+
+def iter_page_text(docs):
+    """Page text block by block (documents separated by a blank line), for streaming ingestion."""
+    for i, doc in enumerate(docs):
+        if i: yield "\n\n"
+        text, start = doc.page_content, 0
+        while start < len(text):
+            end = text.find("\n\n", start)
+            end = len(text) if end < 0 else end + 2
+            yield text[start:end]; start = end
@@ -0,0 +1,44 @@
+"""Cold-start and per-rerun timing for the Streamlit script, checked against a budget."""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+
+import config
+
+# Imported by app.py on its first run, so this approximates when the app process began serving
+PROCESS_START = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_state = {"cold_start_ms": None, "reruns_ms": deque(maxlen=100)}
+
+
+def begin_run():
+    return time.perf_counter()
+
+
+def end_run(started):
+    """Record a finished script run and return the current timing report."""
+    now = time.perf_counter()
+    with _lock:
+        if _state["cold_start_ms"] is None:
+            _state["cold_start_ms"] = (now - PROCESS_START) * 1000
+            verdict = "within" if _state["cold_start_ms"] <= config.COLD_START_BUDGET_MS else "OVER"
+            logger.warning("Cold start %.0f ms (%s budget of %.0f ms)", _state["cold_start_ms"], verdict, config.COLD_START_BUDGET_MS)
+        else:
+            _state["reruns_ms"].append((now - started) * 1000)
+        return report()
+
+
+def report():
+    reruns = list(_state["reruns_ms"])
+    return {
+        "cold_start_ms": _state["cold_start_ms"],
+        "cold_start_budget_ms": config.COLD_START_BUDGET_MS,
+        "last_rerun_ms": reruns[-1] if reruns else None,
+        "p50_rerun_ms": statistics.median(reruns) if reruns else None,
+        "rerun_budget_ms": config.RERUN_BUDGET_MS,
+        "reruns": len(reruns),
+    }
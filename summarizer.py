@@ -0,0 +1,211 @@
+import time
+import zlib
+
+import chunking
+import config
+import tracing
+from map_executor import call_with_backoff, estimate_tokens, run_prompts
+
+# Reduce-prompt input budget when the caller does not size one to the model (load_summarize_chain's default)
+REDUCE_TOKEN_MAX = 3000
+
+
+def _format(prompt, **values):
+    return prompt.format(**{k: v for k, v in values.items() if k in prompt.input_variables})
+
+
+def _join(texts):
+    return "\n\n".join(texts)
+
+
+class StreamInterrupted(RuntimeError):
+    """A streamed completion failed after tokens were already handed to `on_token`; never retried."""
+
+    retryable = False
+
+
+def call_llm(llm, text, limiter=None, max_tokens=0, on_token=None, stage="llm", count_tokens=estimate_tokens):
+    """Invoke the model, streaming tokens to `on_token` when given. Retries 429s only before the first token."""
+    with tracing.span(f"llm.{stage}", streamed=on_token is not None):
+        prompt_tokens = count_tokens(text)
+        if on_token is None:
+            message = call_with_backoff(lambda: llm.invoke(text), limiter, prompt_tokens + max_tokens)
+            tracing.record_usage(message, prompt_tokens, estimate_tokens(message.content))
+            return message.content
+
+        usage = {}
+        def stream():
+            parts = []
+            try:
+                for chunk in llm.stream(text):
+                    if getattr(chunk, "usage_metadata", None): usage["message"] = chunk
+                    if chunk.content:
+                        if not parts: tracing.annotate(first_token_s=round(time.time() - started, 4))
+                        parts.append(chunk.content)
+                        on_token(chunk.content)
+            except Exception as e:
+                if parts: raise StreamInterrupted(f"Stream interrupted after {len(parts)} tokens ({type(e).__name__})") from e
+                raise
+            return "".join(parts)
+        started = time.time()
+        output = call_with_backoff(stream, limiter, prompt_tokens + max_tokens)
+        tracing.record_usage(usage.get("message"), prompt_tokens, estimate_tokens(output))
+        return output
+
+
+def _split_by_tokens(texts, count_tokens, token_max, max_items=None):
+    """Group consecutive texts under `token_max` (and `max_items`), ending groups at content-defined points
+    once mostly full so that one changed summary does not regroup (and re-reduce) everything after it."""
+    groups, current, size = [], [], 0
+    for text in texts:
+        n = count_tokens(text)
+        if current and (size + n > token_max or (max_items and len(current) >= max_items)):
+            groups.append(current); current, size = [], 0
+        current.append(text); size += n
+        if size >= token_max * chunking.MIN_FILL and zlib.crc32(text.encode("utf-8")) % chunking.CUT_DIVISOR == 0:
+            groups.append(current); current, size = [], 0
+    if current: groups.append(current)
+    return groups
+
+
+def _memo_call(memo, key, llm, text, limiter, max_tokens, on_token, stage, count_tokens):
+    """call_llm, answered from the memo when this exact node was computed before."""
+    if memo is not None:
+        output = memo.get(key)
+        if output is not None:
+            if on_token: on_token(output)
+            return output
+    output = call_llm(llm, text, limiter, max_tokens, on_token, stage, count_tokens)
+    if memo is not None: memo.set(key, output)
+    return output
+
+
+def _map_chunks(llm, docs, map_prompt, limiter, concurrency, max_tokens, count_tokens, on_progress, memo):
+    """Map step that only sends chunks without a memoized summary to the model. Returns (summaries, keys).
+
+    `docs` may be a lazy iterable: chunks are looked up and submitted as they are produced.
+    """
+    keys, summaries, missing, mapped = [], [], [], 0
+
+    def report():
+        if on_progress: on_progress("map", len(summaries) - len(missing) + mapped, len(summaries))
+
+    def prompts():
+        for doc in docs:
+            key = memo.key("map", map_prompt.template, doc.page_content) if memo is not None else None
+            summary = memo.get(key) if memo is not None else None
+            keys.append(key); summaries.append(summary)
+            if summary is None:
+                missing.append(len(summaries) - 1)
+                yield _format(map_prompt, text=doc.page_content)
+            else: report()
+
+    def on_result(done, total):
+        nonlocal mapped
+        mapped = done; report()
+
+    fresh = run_prompts(llm, prompts(), limiter, concurrency, max_tokens, on_result, count_tokens, "map")
+    for i, summary in zip(missing, fresh):
+        summaries[i] = summary
+        if memo is not None: memo.set(keys[i], summary)
+    tracing.annotate(map_reused=len(summaries) - len(missing))
+    return summaries, keys
+
+
+def summarize_stuff(llm, docs, prompt, limiter=None, max_tokens=0, count_tokens=estimate_tokens, on_token=None, memo=None):
+    text = _format(prompt, text=_join(d.page_content for d in docs))
+    key = memo.key("stuff", prompt.template, text) if memo else None
+    if memo: memo.tree["levels"].append([key])
+    return _memo_call(memo, key, llm, text, limiter, max_tokens, on_token, "stuff", count_tokens)
+
+
+def _reduce_level(llm, summaries, keys, combine_prompt, limiter, concurrency, max_tokens, count_tokens, on_progress, memo, reduce_tokens, fan_in, level):
+    """Reduce one level of the tree: batches are formed in order and reduced in parallel."""
+    groups = _split_by_tokens(summaries, count_tokens, reduce_tokens, fan_in)
+    if len(groups) == len(summaries):  # nothing fit together; pair up so the tree still shrinks
+        groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+    texts, group_keys, offset = [], [], 0
+    for group in groups:
+        texts.append(_format(combine_prompt, text=_join(group)))
+        child_keys = keys[offset:offset + len(group)]; offset += len(group)
+        group_keys.append(memo.key("reduce", combine_prompt.template, *child_keys) if memo else None)
+    outputs = [memo.get(k) for k in group_keys] if memo else [None] * len(groups)
+    missing = [i for i, out in enumerate(outputs) if out is None]
+    reused = len(groups) - len(missing)
+    progress = (lambda done, total: on_progress(f"reduce:{level}", reused + done, len(groups))) if on_progress else None
+    fresh = run_prompts(llm, [texts[i] for i in missing], limiter, concurrency, max_tokens, progress, count_tokens, "reduce")
+    for i, out in zip(missing, fresh):
+        outputs[i] = out
+        if memo: memo.set(group_keys[i], out)
+    return outputs, group_keys
+
+
+def summarize_map_reduce(llm, docs, map_prompt, combine_prompt, limiter=None, concurrency=4, max_tokens=0,
+                         count_tokens=estimate_tokens, on_progress=None, on_token=None, memo=None,
+                         reduce_tokens=REDUCE_TOKEN_MAX, fan_in=config.REDUCE_FAN_IN):
+    """Map every chunk, then reduce the summaries as a tree with bounded fan-in until one combine fits."""
+    summaries, keys = _map_chunks(llm, docs, map_prompt, limiter, concurrency, max_tokens, count_tokens, on_progress, memo)
+    if memo: memo.tree["leaves"] = keys
+    level = 0
+    while len(summaries) > 1 and (len(summaries) > fan_in or sum(count_tokens(s) for s in summaries) > reduce_tokens):
+        level += 1
+        with tracing.span("reduce.level", level=level, inputs=len(summaries)):
+            summaries, keys = _reduce_level(llm, summaries, keys, combine_prompt, limiter, concurrency, max_tokens, count_tokens, on_progress, memo, reduce_tokens, fan_in, level)
+        if memo: memo.tree["levels"].append(keys)
+    tracing.annotate(reduce_depth=level)
+    key = memo.key("reduce", combine_prompt.template, *keys) if memo else None
+    if memo: memo.tree["levels"].append([key])
+    text = _format(combine_prompt, text=_join(summaries))
+    return _memo_call(memo, key, llm, text, limiter, max_tokens, on_token, "combine", count_tokens)
+
+
+def summarize_refine(llm, docs, question_prompt, refine_prompt, limiter=None, max_tokens=0,
+                     count_tokens=estimate_tokens, on_progress=None, on_token=None, memo=None):
+    # Each step's key chains the previous step's key, so an edit re-runs refine from that chunk onward only
+    answer, key = None, ""
+    docs = iter(docs)
+    doc, i = next(docs, None), 0
+    while doc is not None:
+        following = next(docs, None)  # one chunk of lookahead tells whether this is the (streamed) last step
+        if answer is None: text = _format(question_prompt, text=doc.page_content)
+        else: text = _format(refine_prompt, text=doc.page_content, existing_answer=answer)
+        if memo:
+            key = memo.key("refine", question_prompt.template, refine_prompt.template, key, doc.page_content)
+            memo.tree["leaves"].append(key)
+        answer = _memo_call(memo, key, llm, text, limiter, max_tokens, on_token if following is None else None, "refine", count_tokens)
+        i += 1
+        if on_progress: on_progress("refine", i, i if following is None else i + 1)
+        doc = following
+    return answer
+
+
+def summarize_documents(llm, chain_type, docs, map_prompt, combine_prompt, refine_prompt=None, limiter=None, concurrency=4, max_tokens=0,
+                        count_tokens=estimate_tokens, on_progress=None, on_token=None, memo=None,
+                        reduce_tokens=REDUCE_TOKEN_MAX, fan_in=config.REDUCE_FAN_IN):
+    """Run the chosen summarization strategy; only the final LLM call is streamed.
+
+    `docs` may be a list or a lazy iterable of chunks (see pipeline.ChunkStream); map_reduce and
+    refine start on the first chunks while later ones are still being produced.
+    With a `chunk_memo.MemoScope`, previously computed map/reduce/refine nodes are reused.
+    """
+    chunks = 0
+
+    def counted():
+        nonlocal chunks
+        for doc in docs:
+            chunks += 1; yield doc
+
+    with tracing.span("summarize", chain_type=chain_type):
+        docs_in = counted()
+        if chain_type == "map_reduce":
+            result = summarize_map_reduce(llm, docs_in, map_prompt, combine_prompt, limiter, concurrency, max_tokens, count_tokens, on_progress, on_token, memo, reduce_tokens, fan_in)
+        elif chain_type == "stuff":
+            result = summarize_stuff(llm, docs_in, map_prompt, limiter, max_tokens, count_tokens, on_token, memo)
+        else:
+            if refine_prompt is None: raise ValueError("refine needs a refine_prompt with {existing_answer}")
+            result = summarize_refine(llm, docs_in, map_prompt, refine_prompt, limiter, max_tokens, count_tokens, on_progress, on_token, memo)
+        tracing.annotate(chunks=chunks)
+        if memo:
+            reused = memo.save_tree()
+            tracing.annotate(memo_hits=memo.hits, memo_misses=memo.misses, tree_reused=reused)
+        return result
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that never change the page content (tracking, share links); `ref` is kept, e.g. GitHub ?ref=<branch>
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "mc_cid", "mc_eid", "igshid", "ref_src", "si", "feature"}
+
+
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."): host = host[4:]
+    if parts.port and parts.port not in (80, 443): host = f"{host}:{parts.port}"
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(((parts.scheme or "https").lower(), host, path, urlencode(sorted(query)), ""))
+
+
+def source_key(url, video_id=None):
+    """Normalized identity of a source: the video ID for YouTube, the canonical URL otherwise."""
+    if video_id: return f"youtube:{video_id}"
+    return f"url:{canonical_url(url)}"
+
+
+def prompt_hash(*templates):
+    return hashlib.sha256("\x00".join(templates).encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(source, model_name, chain_type, max_tokens, prompts_digest):
+    raw = json.dumps([source, model_name, chain_type, int(max_tokens), prompts_digest])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """SQLite-backed summary store with LRU eviction (entry count and bytes) and TTL expiry."""
+
+    def __init__(self, path, max_entries=2000, max_bytes=64 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = self.misses = self.expired = self.evictions = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY, source TEXT, summary TEXT, meta TEXT,
+            size INTEGER, created_at REAL, last_access REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_lru ON summaries(last_access)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT summary, meta, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                self.expired += 1; self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return {"summary": row[0], "meta": json.loads(row[1] or "{}"), "created_at": row[2]}
+
+    def set(self, key, source, summary, meta=None):
+        now = time.time()
+        meta_json = json.dumps(meta or {})
+        size = len(summary.encode("utf-8")) + len(meta_json)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?)", (key, source, summary, meta_json, size, now, now))
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self.expired += self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes: return
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM summaries ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes: break
+            self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+            count -= 1; total -= size; evicted += 1
+        self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        lookups = self.hits + self.misses
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses, "expired": self.expired,
+                "evictions": self.evictions, "hit_rate": (self.hits / lookups) if lookups else 0.0}
@@ -0,0 +1,84 @@
+import functools
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Context window, output ceiling and Hugging Face tokenizer for each Groq model offered in the UI.
+# Gemma/Llama tokenizers point at ungated mirrors so no HF token is needed (see config.TOKENIZER_REPOS).
+# `chars_per_token` is only used when the tokenizer cannot be loaded (offline, gated repo, ...).
+MODEL_REGISTRY = {
+    "gemma-7b-it": {"context_window": 8192, "max_output_tokens": 8192, "tokenizer": "unsloth/gemma-7b-it", "chars_per_token": 4.0},
+    "llama3-8b-8192": {"context_window": 8192, "max_output_tokens": 8192, "tokenizer": "NousResearch/Meta-Llama-3-8B-Instruct", "chars_per_token": 4.2},
+    "mixtral-8x7b-32768": {"context_window": 32768, "max_output_tokens": 32768, "tokenizer": "mistralai/Mixtral-8x7B-Instruct-v0.1", "chars_per_token": 3.6},
+}
+DEFAULT_MODEL_INFO = {"context_window": 8192, "max_output_tokens": 4096, "tokenizer": None, "chars_per_token": 4.0}
+
+SAFETY_MARGIN = 0.92  # leaves room for chat-template tokens and tokenizer mismatch
+CHUNK_OVERLAP_TOKENS = 64
+MIN_CHUNK_TOKENS = 256
+
+
+def model_info(model_name):
+    return MODEL_REGISTRY.get(model_name, DEFAULT_MODEL_INFO)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    """Fast HF tokenizer for the model, or None if it cannot be loaded."""
+    repo = config.TOKENIZER_REPOS.get(model_name, model_info(model_name)["tokenizer"])
+    if not repo: return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(repo, local_files_only=config.TOKENIZER_LOCAL_FILES_ONLY)
+    except Exception as e:
+        logger.warning("Tokenizer %s unavailable (%s); falling back to character estimate", repo, e)
+        return None
+
+
+def token_counter(model_name):
+    tokenizer = get_tokenizer(model_name)
+    if tokenizer is not None:
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    chars_per_token = model_info(model_name)["chars_per_token"]
+    return lambda text: int(len(text) / chars_per_token) + 1
+
+
+def count_tokens(model_name, text):
+    return token_counter(model_name)(text)
+
+
+def prompt_overhead(model_name, template):
+    return count_tokens(model_name, template.replace("{text}", "").replace("{existing_answer}", ""))
+
+
+def chunk_token_budget(model_name, chain_type, max_tokens, map_template, refine_template):
+    """Largest chunk (in tokens) that still leaves room for the prompt and the requested output."""
+    info = model_info(model_name)
+    max_tokens = min(max_tokens, info["max_output_tokens"])
+    overhead = prompt_overhead(model_name, map_template)
+    reserved = max_tokens
+    if chain_type == "refine":  # refine prompts also carry the running summary
+        overhead = max(overhead, prompt_overhead(model_name, refine_template))
+        reserved += max_tokens
+    usable = int((info["context_window"] - overhead - reserved) * SAFETY_MARGIN)
+    return max(MIN_CHUNK_TOKENS, usable)
+
+
+def reduce_token_budget(model_name, max_tokens, combine_template):
+    """How many tokens of partial summaries one reduce/combine prompt can take."""
+    info = model_info(model_name)
+    max_tokens = min(max_tokens, info["max_output_tokens"])
+    usable = int((info["context_window"] - prompt_overhead(model_name, combine_template) - max_tokens) * SAFETY_MARGIN)
+    return max(2 * max_tokens, usable)
+
+
+def make_text_splitter(model_name, chunk_tokens, content_defined=True):
+    """Content-defined chunks by default (stable under edits, see chunking.py); greedy recursive packing otherwise."""
+    if content_defined:
+        from chunking import ContentDefinedSplitter
+        return ContentDefinedSplitter(chunk_tokens, token_counter(model_name))
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    overlap = min(CHUNK_OVERLAP_TOKENS, chunk_tokens // 10)
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_tokens, chunk_overlap=overlap, length_function=token_counter(model_name))
@@ -0,0 +1,352 @@
+"""Spans for every pipeline stage and LLM call, with Prometheus text and JSON-lines export.
+
+Usage:
+    trace = tracing.Trace("request", url=url)
+    with tracing.activate(trace):
+        with tracing.span("split"): ...
+    trace.finish()
+
+Spans opened while a trace is active are attached to it; all spans feed the process-wide
+aggregates in `REGISTRY` whether or not a trace is active (the batch CLI relies on that).
+Files are written by a background thread (`EXPORTER`), never by the thread that recorded the span.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+SAMPLES_PER_STAGE = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "start", "end", "attrs")
+
+    def __init__(self, name, trace_id=None, **attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.start = time.time()
+        self.end = None
+        self.attrs = attrs
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {"name": self.name, "trace_id": self.trace_id, "start": round(self.start, 6), "duration": round(self.duration, 6), **self.attrs}
+
+
+class Trace:
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.end = None
+        self.spans = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, span):
+        with self._lock: self.spans.append(span)
+
+    def finish(self):
+        self.end = time.time()
+        if self._token is not None:
+            try: _current_trace.reset(self._token)
+            except ValueError: pass  # finished from another thread/context than it was started in
+            self._token = None
+        REGISTRY.observe_duration(self.name, self.end - self.start)
+        EXPORTER.metrics_changed()
+        return self
+
+    def breakdown(self):
+        """Per-stage totals for this trace, in first-seen order."""
+        with self._lock: spans = list(self.spans)
+        stages = {}
+        for s in spans:
+            row = stages.setdefault(s.name, {"stage": s.name, "calls": 0, "seconds": 0.0, "max_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "queue_wait_s": 0.0})
+            row["calls"] += 1; row["seconds"] += s.duration; row["max_s"] = max(row["max_s"], s.duration)
+            for key in ("prompt_tokens", "completion_tokens", "retries"): row[key] += s.attrs.get(key, 0)
+            row["queue_wait_s"] += s.attrs.get("queue_wait", 0.0)
+        for row in stages.values():
+            row["seconds"] = round(row["seconds"], 3); row["max_s"] = round(row["max_s"], 3); row["queue_wait_s"] = round(row["queue_wait_s"], 3)
+        return list(stages.values())
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_STAGE))
+        self.counts = defaultdict(int)
+        self.sums = defaultdict(float)
+        self.prompt_tokens = defaultdict(int)
+        self.completion_tokens = defaultdict(int)
+        self.llm_seconds = defaultdict(float)
+        self.retries = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.cache = defaultdict(lambda: {"hit": 0, "miss": 0})
+
+    def observe_duration(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1; self.sums[stage] += seconds
+
+    def observe(self, span):
+        self.observe_duration(span.name, span.duration)
+        with self._lock:
+            if "prompt_tokens" in span.attrs or "completion_tokens" in span.attrs:
+                self.prompt_tokens[span.name] += span.attrs.get("prompt_tokens", 0)
+                self.completion_tokens[span.name] += span.attrs.get("completion_tokens", 0)
+                self.llm_seconds[span.name] += span.duration
+            self.retries[span.name] += span.attrs.get("retries", 0)
+            if "error" in span.attrs: self.errors[span.name] += 1
+
+    def record_cache(self, cache_name, hit):
+        with self._lock: self.cache[cache_name]["hit" if hit else "miss"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for stage, values in self.samples.items():
+                ordered = sorted(values)
+                stages[stage] = {"count": self.counts[stage], "sum_s": round(self.sums[stage], 6), **{f"p{int(q * 100)}_s": round(_quantile(ordered, q), 6) for q in QUANTILES},
+                                 "prompt_tokens": self.prompt_tokens.get(stage, 0), "completion_tokens": self.completion_tokens.get(stage, 0),
+                                 "retries": self.retries.get(stage, 0), "errors": self.errors.get(stage, 0)}
+                if self.llm_seconds.get(stage): stages[stage]["tokens_per_s"] = round(self.completion_tokens[stage] / self.llm_seconds[stage], 2)
+            caches = {}
+            for name, c in self.cache.items():
+                total = c["hit"] + c["miss"]
+                caches[name] = {**c, "hit_rate": round(c["hit"] / total, 4) if total else 0.0}
+        return {"timestamp": time.time(), "stages": stages, "caches": caches}
+
+    def prometheus_text(self):
+        snap = self.snapshot()
+        lines = ["# HELP summarizer_stage_seconds Latency of pipeline stages and LLM calls.", "# TYPE summarizer_stage_seconds summary"]
+        for stage, s in sorted(snap["stages"].items()):
+            for q in QUANTILES: lines.append(f'summarizer_stage_seconds{{stage="{stage}",quantile="{q}"}} {s[f"p{int(q * 100)}_s"]}')
+            lines.append(f'summarizer_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+            lines.append(f'summarizer_stage_seconds_sum{{stage="{stage}"}} {s["sum_s"]}')
+        lines += ["# HELP summarizer_llm_tokens_total LLM tokens by stage and kind.", "# TYPE summarizer_llm_tokens_total counter"]
+        for stage, s in sorted(snap["stages"].items()):
+            if s["prompt_tokens"] or s["completion_tokens"]:
+                lines.append(f'summarizer_llm_tokens_total{{stage="{stage}",kind="prompt"}} {s["prompt_tokens"]}')
+                lines.append(f'summarizer_llm_tokens_total{{stage="{stage}",kind="completion"}} {s["completion_tokens"]}')
+        lines += ["# HELP summarizer_llm_tokens_per_second Completion tokens per second of LLM call time.", "# TYPE summarizer_llm_tokens_per_second gauge"]
+        for stage, s in sorted(snap["stages"].items()):
+            if "tokens_per_s" in s: lines.append(f'summarizer_llm_tokens_per_second{{stage="{stage}"}} {s["tokens_per_s"]}')
+        lines += ["# HELP summarizer_retries_total Rate-limit retries by stage.", "# TYPE summarizer_retries_total counter"]
+        lines += [f'summarizer_retries_total{{stage="{stage}"}} {s["retries"]}' for stage, s in sorted(snap["stages"].items())]
+        lines += ["# HELP summarizer_errors_total Failed spans by stage.", "# TYPE summarizer_errors_total counter"]
+        lines += [f'summarizer_errors_total{{stage="{stage}"}} {s["errors"]}' for stage, s in sorted(snap["stages"].items())]
+        lines += ["# HELP summarizer_cache_requests_total Cache lookups by result.", "# TYPE summarizer_cache_requests_total counter"]
+        for name, c in sorted(snap["caches"].items()):
+            lines.append(f'summarizer_cache_requests_total{{cache="{name}",result="hit"}} {c["hit"]}')
+            lines.append(f'summarizer_cache_requests_total{{cache="{name}",result="miss"}} {c["miss"]}')
+        lines += ["# HELP summarizer_cache_hit_ratio Cache hit ratio.", "# TYPE summarizer_cache_hit_ratio gauge"]
+        lines += [f'summarizer_cache_hit_ratio{{cache="{name}"}} {c["hit_rate"]}' for name, c in sorted(snap["caches"].items())]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=config.METRICS_PROM_PATH):
+        """Atomically rewrite the textfile-collector file (a failed export is logged, never raised)."""
+        if not path: return
+        try:
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(self.prometheus_text())
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            logger.warning("Could not write %s: %s", path, e)
+
+    def append_snapshot(self, path=config.METRICS_JSONL_PATH):
+        if path: _append_lines(path, json.dumps(self.snapshot()) + "\n")
+
+
+REGISTRY = MetricsRegistry()
+_log_lock = threading.Lock()
+
+
+def _append_lines(path, text, max_bytes=int(config.METRICS_LOG_MAX_MB * 1024 * 1024)):
+    """Append to a JSON-lines log, rotating it to `<path>.1` at `max_bytes` (a failed write is logged, never raised)."""
+    try:
+        with _log_lock:
+            if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+            if max_bytes and os.path.exists(path) and os.path.getsize(path) + len(text) > max_bytes: os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f: f.write(text)
+    except OSError as e:
+        logger.warning("Could not append to %s: %s", path, e)
+
+
+class Exporter:
+    """Writes spans.jsonl, the .prom file and aggregates.jsonl from one background thread.
+
+    Span lines are queued (dropped and counted if the writer falls `max_pending` behind) and
+    appended in batches; the metrics files are rewritten at most once per `metrics_interval`
+    after a trace finishes, instead of on every request. Pending output is flushed at exit.
+    """
+
+    def __init__(self, max_pending=10000, metrics_interval=1.0):
+        self.metrics_interval = metrics_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._metrics_due = threading.Event()
+        self._wake = threading.Event()
+        self._metrics_written = 0.0
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None: return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def span(self, span):
+        if not config.TRACE_LOG_PATH: return
+        self._ensure_started()
+        try: self._queue.put_nowait(span.to_dict())
+        except queue.Full: self.dropped += 1
+        self._wake.set()
+
+    def metrics_changed(self):
+        if not (config.METRICS_PROM_PATH or config.METRICS_JSONL_PATH): return
+        self._ensure_started()
+        self._metrics_due.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.metrics_interval)
+            self._wake.clear()
+            self._write()
+
+    def flush(self):
+        """Write everything queued so far (and the metrics files, if due) from the calling thread."""
+        self._write(force_metrics=True)
+
+    def _write(self, force_metrics=False):
+        records = []
+        with self._flush_lock:
+            while True:
+                try: records.append(self._queue.get_nowait())
+                except queue.Empty: break
+            if records: _append_lines(config.TRACE_LOG_PATH, "".join(json.dumps(r, default=str) + "\n" for r in records))
+            due = self._metrics_due.is_set() and (force_metrics or time.time() - self._metrics_written >= self.metrics_interval)
+            if due:
+                self._metrics_due.clear(); self._metrics_written = time.time()
+                REGISTRY.write_prometheus(); REGISTRY.append_snapshot()
+
+
+EXPORTER = Exporter()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def activate(trace):
+    """Attach spans to `trace` inside this block, e.g. in a worker thread handling part of a request."""
+    token = _current_trace.set(trace)
+    try: yield trace
+    finally: _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    trace = _current_trace.get()
+    s = Span(name, trace.id if trace else None, **attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.end = time.time()
+        _current_span.reset(token)
+        if trace: trace.add(s)
+        REGISTRY.observe(s)
+        EXPORTER.span(s)
+
+
+def record_span(name, seconds, **attrs):
+    """Record a span for work that was not one contiguous block, e.g. a generator resumed between other stages."""
+    trace = _current_trace.get()
+    s = Span(name, trace.id if trace else None, **attrs)
+    s.start = time.time() - seconds; s.end = s.start + seconds
+    if trace: trace.add(s)
+    REGISTRY.observe(s)
+    EXPORTER.span(s)
+    return s
+
+
+def annotate(**attrs):
+    """Set attributes on the innermost open span (no-op outside a span)."""
+    s = _current_span.get()
+    if s is not None: s.attrs.update(attrs)
+
+
+def increment(key, amount=1):
+    s = _current_span.get()
+    if s is not None: s.attrs[key] = s.attrs.get(key, 0) + amount
+
+
+def record_cache(cache_name, hit):
+    REGISTRY.record_cache(cache_name, hit)
+
+
+def record_usage(message, fallback_prompt_tokens=0, fallback_completion_tokens=0):
+    """Copy token usage from a LangChain AI message (or chunk) onto the current span."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    annotate(prompt_tokens=usage.get("input_tokens", fallback_prompt_tokens), completion_tokens=usage.get("output_tokens", fallback_completion_tokens))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"): body, ctype = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"): body, ctype = REGISTRY.prometheus_text().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404); return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
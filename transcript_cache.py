@@ -0,0 +1,80 @@
+"""On-disk cache for YouTube transcript resolution.
+
+Three things are kept per video: the transcript listing (including "no transcripts", for a shorter
+time), every fetched or translated transcript keyed by language ("en", or "hi>en" for Hindi
+translated to English), and which of those the last successful resolution used. A repeat request
+is then answered without touching YouTube.
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+STRATEGY_TTL_SECONDS = 30 * 24 * 3600  # which fallback worked outlives the cached text itself
+
+
+class TranscriptCache:
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, negative_ttl_seconds=3600, max_entries=5000):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS listings (video_id TEXT PRIMARY KEY, listing TEXT, created_at REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS texts (video_id TEXT, lang TEXT, segments TEXT, created_at REAL, PRIMARY KEY (video_id, lang))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS texts_age ON texts(created_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS strategies (video_id TEXT PRIMARY KEY, lang TEXT, updated_at REAL)")
+
+    def get_listing(self, video_id):
+        """[{"code", "name", "generated", "translatable"}, ...] ([] if the video has none), or None if unknown/expired."""
+        with self._lock: row = self._conn.execute("SELECT listing, created_at FROM listings WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None: return None
+        listing = json.loads(row[0])
+        ttl = self.ttl_seconds if listing else self.negative_ttl_seconds
+        return listing if not ttl or time.time() - row[1] <= ttl else None
+
+    def set_listing(self, video_id, listing):
+        with self._lock: self._conn.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?)", (video_id, json.dumps(listing), time.time()))
+
+    def get_text(self, video_id, lang):
+        with self._lock: row = self._conn.execute("SELECT segments, created_at FROM texts WHERE video_id = ? AND lang = ?", (video_id, lang)).fetchone()
+        if row is None or (self.ttl_seconds and time.time() - row[1] > self.ttl_seconds): return None
+        return json.loads(row[0])
+
+    def set_text(self, video_id, lang, segments):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO texts VALUES (?, ?, ?, ?)", (video_id, lang, json.dumps(segments, ensure_ascii=False), now))
+            self._writes += 1
+            if self._writes % 100 == 0: self._prune(now)
+
+    def get_strategy(self, video_id):
+        with self._lock: row = self._conn.execute("SELECT lang, updated_at FROM strategies WHERE video_id = ?", (video_id,)).fetchone()
+        return row[0] if row and time.time() - row[1] <= STRATEGY_TTL_SECONDS else None
+
+    def set_strategy(self, video_id, lang):
+        with self._lock: self._conn.execute("INSERT OR REPLACE INTO strategies VALUES (?, ?, ?)", (video_id, lang, time.time()))
+
+    def _prune(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM texts WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute("DELETE FROM listings WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute("DELETE FROM strategies WHERE updated_at < ?", (now - STRATEGY_TTL_SECONDS,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM texts").fetchone()[0] - self.max_entries
+        if excess > 0: self._conn.execute("DELETE FROM texts WHERE rowid IN (SELECT rowid FROM texts ORDER BY created_at ASC LIMIT ?)", (excess,))
+
+
+@functools.lru_cache(maxsize=None)
+def default_cache():
+    """Process-wide cache from config (None when TRANSCRIPT_CACHE_PATH is empty)."""
+    if not config.TRANSCRIPT_CACHE_PATH: return None
+    return TranscriptCache(config.TRANSCRIPT_CACHE_PATH, ttl_seconds=config.TRANSCRIPT_CACHE_TTL_HOURS * 3600,
+                           negative_ttl_seconds=config.TRANSCRIPT_NEGATIVE_TTL_MINUTES * 60, max_entries=config.TRANSCRIPT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,173 @@
+"""Lightweight article extraction: pooled HTTP, conditional GETs and readability-style scoring."""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+VALIDATOR_STORE_MAX_AGE = 30 * 24 * 3600
+REQUEST_TIMEOUT = (5, 20)
+USER_AGENT = "Mozilla/5.0"
+
+DROP_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "form", "nav", "footer", "header", "aside", "button", "select"]
+NEGATIVE_HINTS = re.compile(r"comment|meta|footer|footnote|foot|nav|menu|sidebar|side-bar|cookie|consent|banner|share|social|promo|related|recommend|advert|\bads?\b|sponsor|popup|modal|newsletter|subscribe|breadcrumb|masthead|skip", re.I)
+POSITIVE_HINTS = re.compile(r"article|body|content|entry|main|page|post|story|text|blog", re.I)
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "pre", "blockquote", "td", "dd", "figcaption"}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide pooled session (keep-alive connections are reused across requests)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+            session.mount("http://", adapter); session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5", "Accept-Encoding": "gzip, deflate"})
+            session.verify = False  # matches the ssl_verify=False the app has always used for websites
+            _session = session
+        return _session
+
+
+class ValidatorStore:
+    """ETag/Last-Modified per URL together with the text extracted from that version of the page."""
+
+    def __init__(self, path=config.HTTP_VALIDATOR_STORE_PATH, max_age=VALIDATOR_STORE_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, text TEXT, title TEXT, fetched_at REAL)")
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified, text, title, fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None or time.time() - row[4] > self.max_age: return None
+        return {"etag": row[0], "last_modified": row[1], "text": row[2], "title": row[3]}
+
+    def put(self, url, etag, last_modified, text, title):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", (url, etag, last_modified, text, title, now))
+            self._conn.execute("DELETE FROM pages WHERE fetched_at < ?", (now - self.max_age,))
+
+
+_store = None
+
+
+def get_validator_store():
+    global _store
+    with _session_lock:
+        if _store is None: _store = ValidatorStore()
+        return _store
+
+
+def _text(el):
+    return " ".join(el.text_content().split())
+
+
+def _link_density(el, text_len):
+    link_len = sum(len(_text(a)) for a in el.iter("a"))
+    return link_len / text_len if text_len else 1.0
+
+
+def _class_weight(el):
+    hints = f"{el.get('class', '')} {el.get('id', '')}"
+    weight = 0
+    if NEGATIVE_HINTS.search(hints): weight -= 25
+    if POSITIVE_HINTS.search(hints): weight += 25
+    return weight
+
+
+_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+
+
+def declared_charset(content_type):
+    """Charset named in a Content-Type header, or None (requests' ISO-8859-1 default for text/* is not a declaration)."""
+    match = _CHARSET.search(content_type or "")
+    return match.group(1) if match else None
+
+
+def _decode(content, declared_encoding, is_html=True):
+    from bs4 import UnicodeDammit
+    dammit = UnicodeDammit(content, [declared_encoding] if declared_encoding else [], is_html=is_html)
+    return dammit.unicode_markup or content.decode("utf-8", errors="replace")
+
+
+def extract_main_text(html):
+    """Return (title, text) of the page's main content; text is blank-line separated blocks."""
+    import lxml.html
+    doc = lxml.html.document_fromstring(html)
+    title = _text(doc.find(".//title")) if doc.find(".//title") is not None else ""
+    for el in list(doc.iter(*DROP_TAGS)): el.drop_tree()
+    for el in list(doc.iter("div", "section", "ul", "table", "span")):
+        if el.getparent() is not None and NEGATIVE_HINTS.search(f"{el.get('class', '')} {el.get('id', '')}") and not POSITIVE_HINTS.search(f"{el.get('class', '')} {el.get('id', '')}"):
+            el.drop_tree()
+
+    # Score each paragraph's parent (full credit) and grandparent (half credit), as readability does
+    scores = {}
+    for p in doc.iter("p", "pre", "td", "blockquote"):
+        text = _text(p)
+        if len(text) < 25: continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for el, share in ((p.getparent(), 1.0), (p.getparent().getparent() if p.getparent() is not None else None, 0.5)):
+            if el is None: continue
+            if el not in scores: scores[el] = _class_weight(el)
+            scores[el] += score * share
+    if not scores:
+        body = doc.find(".//body")
+        return title, _text(body if body is not None else doc)
+    for el in scores:
+        scores[el] *= 1 - _link_density(el, len(_text(el)))
+    best = max(scores, key=scores.get)
+
+    # Pull in siblings that look like continuations of the article body
+    threshold = max(10, scores[best] * 0.2)
+    parent = best.getparent()
+    containers = [best] if parent is None else [s for s in parent if s is best or scores.get(s, 0) >= threshold]
+    blocks = []
+    for container in containers:
+        for el in container.iter():
+            if el.tag in BLOCK_TAGS and not any(a.tag in BLOCK_TAGS for a in el.iterancestors()):
+                text = _text(el)
+                if text and _link_density(el, len(text)) < 0.5: blocks.append(text)
+    return title, "\n\n".join(blocks)
+
+
+def fetch_main_text(url):
+    """Fetch `url` (revalidating with a conditional GET when possible) and extract its main text.
+
+    Returns a dict with title, text, status ("fresh", "not_modified") and content_type,
+    or None when the response is not HTML.
+    """
+    session, store = get_session(), get_validator_store()
+    known = store.get(url)
+    headers = {}
+    if known and known["etag"]: headers["If-None-Match"] = known["etag"]
+    if known and known["last_modified"]: headers["If-Modified-Since"] = known["last_modified"]
+    resp = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if resp.status_code == 304 and known:
+        return {"title": known["title"], "text": known["text"], "status": "not_modified", "content_type": "text/html"}
+    resp.raise_for_status()
+    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type and "html" not in content_type and content_type != "text/plain": return None
+    # Without a declared charset, UnicodeDammit checks the BOM and <meta charset> before guessing
+    charset = declared_charset(resp.headers.get("Content-Type"))
+    if content_type == "text/plain":
+        title, text = "", _decode(resp.content, charset, is_html=False)
+    else:
+        title, text = extract_main_text(_decode(resp.content, charset))
+    etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    if etag or last_modified: store.put(url, etag, last_modified, text, title)
+    return {"title": title, "text": text, "status": "fresh", "content_type": content_type or "text/html"}